@@ -1,4 +1,10 @@
 import dash
 
+from .metrics import instrumentApp
+
 app = dash.Dash("CS 395 P0", suppress_callback_exceptions=True)
-server = app.server
\ No newline at end of file
+server = app.server
+
+# every callback registered with app.callback records how long it took, how many rows it scanned and how many points
+# and bytes it sent back, see /metrics
+instrumentApp(app)
\ No newline at end of file
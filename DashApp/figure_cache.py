@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import CACHE_REQUESTS
+
+# how many figures are kept, and for how long (in seconds), before they have to be built again
+FIGURE_CACHE_SIZE = 256
+FIGURE_CACHE_TTL = 15 * 60
+
+# a bounded cache of serialized figures, evicting the least recently used one when it is full and expiring each one after ttl seconds
+# every figure is stored along with the version of the data it was built from (see data_parser.getDataVersion),
+# the cache empties itself the first time it is used after the data was reloaded
+class FigureCache:
+    def __init__(self, name : str, max_entries : int = FIGURE_CACHE_SIZE, ttl : float = FIGURE_CACHE_TTL):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (time it expires, figure json), least recently used first
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # empties the cache if the data changed since the figures in it were built, call with the lock held
+    def checkVersion(self, version : str):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    # returns the figure json stored under key, or None if it is not stored (or has expired)
+    def get(self, key : tuple, version : str) -> str:
+        with self.lock:
+            self.checkVersion(version)
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+        CACHE_REQUESTS.increment({'cache' : self.name, 'result' : 'miss' if entry is None else 'hit'})
+        return None if entry is None else entry[1]
+
+    def put(self, key : tuple, version : str, figure_json : str):
+        with self.lock:
+            self.checkVersion(version)
+            self.entries[key] = (time.monotonic() + self.ttl, figure_json)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    # returns how many figures are stored and how many lookups found one
+    def stats(self) -> dict:
+        with self.lock:
+            return {'entries' : len(self.entries), 'hits' : self.hits, 'misses' : self.misses}
+
+# shared by the sensor graphs of every page, so a selection made on one page is cached for the others too
+FIGURE_CACHE = FigureCache('figure')
\ No newline at end of file
@@ -0,0 +1,396 @@
+# builds the sensor graphs shared by the Home, Q2 and Q3 pages
+
+# DASH
+import dash
+from dash.dependencies import Input, Output, State
+
+# PLOTLY
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+# PANDAS
+import pandas as pd
+import numpy as np
+
+import functools
+import json
+import uuid
+
+# DATETIME
+from datetime import datetime, time
+
+from data_parser import getData
+from data_catalog import listSubsystems, listSensors, listParameters
+from data_filters import filterByNodeId, filterBySensorPath, filterByDay, getTimeOfDay, ONE_DAY
+from data_rollups import pickRollup, rollupMovingAverage
+from downsampling import downsample
+from .app import app
+from .figure_cache import FIGURE_CACHE
+from .jobs import submitJob, finishedJob, pollJob, reportProgress, JobCancelled
+from .result_cache import getResult, putResult, sharesResults
+from data_parser import getDataVersion
+
+# colors
+DAY_COLORS = {
+    24 : 'red',
+    25 : 'green',
+    26 : 'blue',
+    27 : 'purple',
+    28 : 'yellow',
+    29 : 'orange',
+    30 : 'black'
+}
+
+# day of the week
+DAYS_OF_THE_WEEK = {
+    24 : 'Monday',
+    25 : 'Tuesday',
+    26 : 'Wednesday',
+    27 : 'Thursday',
+    28 : 'Friday',
+    29 : 'Saturday',
+    30 : 'Sunday'
+}
+
+downsampling_opts = [
+    {
+        'label' : 'Downsample: Largest Triangle Three Buckets',
+        'value' : 'lttb'
+    },
+    {
+        'label' : 'Downsample: Min/Max Per Bucket',
+        'value' : 'minmax'
+    },
+    {
+        'label' : 'Every Point',
+        'value' : 'none'
+    }
+]
+
+# used when the width of the graph is not known, the pages only build their graph once the browser has reported it
+DEFAULT_GRAPH_WIDTH = 1000
+
+# how often (in milliseconds) a page checks whether its sensor graph has been resized
+GRAPH_MEASURE_INTERVAL = 250
+
+# how often (in milliseconds) a page checks on the job building its sensor graph
+GRAPH_POLL_INTERVAL = 250
+
+# every day is plotted against the time of day on this date, so the subplots share one time axis that plotly can zoom into
+REFERENCE_DAY = pd.Timestamp(2020, 1, 1)
+
+# returns the time of day range (as timedeltas from midnight) the user zoomed the sensor graph into, from its relayoutData
+# returns None if the graph shows the whole day, and False if relayoutData does not change the x axis (e.g. a y axis zoom)
+def parseZoom(relayoutData : dict):
+    if not relayoutData:
+        return None
+
+    for key, value in relayoutData.items():
+        if key.startswith('xaxis') and key.endswith('.autorange'):
+            return None
+
+        # zooming gives 'xaxis.range[0]' and 'xaxis.range[1]', setting the range directly gives 'xaxis.range'
+        axis = key.split('.')[0]
+        if key == axis + '.range[0]' and axis + '.range[1]' in relayoutData:
+            start, end = value, relayoutData[axis + '.range[1]']
+        elif key == axis + '.range' and axis.startswith('xaxis'):
+            start, end = value
+        else:
+            continue
+
+        if axis.startswith('xaxis'):
+            return (pd.Timestamp(start) - REFERENCE_DAY, pd.Timestamp(end) - REFERENCE_DAY)
+
+    return False
+
+# returns the ids of the components whose properties set off the callback being run, an empty set when the page was just loaded
+def triggeredIds() -> set:
+    return {trigger['prop_id'].rsplit('.', 1)[0] for trigger in dash.callback_context.triggered} - {''}
+
+# works out what the dropdowns selecting the sensor path of a graph should show, given the ids of the node, subsystem, sensor
+# and parameter dropdowns and the path they selected, once the user changed one of them
+# every dropdown under the one that changed is reset to its first option (the subsystem to the given one, if the node has it),
+# all of them when the page was just loaded, so the path is valid again
+# returns the options, value and disabled state of the subsystem, sensor and parameter dropdowns (no_update for the ones that
+# stay as they are), and the path they select now
+def selectSensorPath(dropdown_ids : list, path : list, subsystem : str = None):
+    triggered = triggeredIds()
+    changed = min([level for level, dropdown_id in enumerate(dropdown_ids) if dropdown_id in triggered], default=0 if len(triggered) == 0 else len(dropdown_ids))
+
+    path = list(path)
+    listings = [None, listSubsystems, listSensors, listParameters] # from the catalog, instead of scanning the data
+    outputs = list()
+    for level in range(1, len(dropdown_ids)):
+        if level <= changed:
+            outputs.extend([dash.no_update] * 3)
+            continue
+
+        values = listings[level](*path[:level])
+        if len(values) == 0:
+            raise dash.exceptions.PreventUpdate("Could not update the {} dropdown, since there is nothing to select.".format(dropdown_ids[level]))
+        path[level] = subsystem if level == 1 and subsystem in values else values[0]
+        outputs.extend([[{'label' : value, 'value' : value} for value in values], path[level], False])
+
+    return outputs, path
+
+# reports the width of a graph (in pixels) to a dcc.Store whenever trigger changes, so traces can be downsampled to fit it
+# the store is only written when the width changed, so the pages trigger it with a dcc.Interval that keeps running (every
+# GRAPH_MEASURE_INTERVAL) and the graph is only rebuilt when it was resized: anything the graph callbacks update would make
+# the callbacks a cycle, since the callback that submits the graph (see submitSensorFigure) takes the width as an input
+def registerGraphWidthCallback(graph_id : str, store_id : str, trigger : Input):
+    app.clientside_callback(
+        """
+        function(trigger, current_width) {
+            var graph = document.getElementById('""" + graph_id + """');
+            if (!graph || graph.offsetWidth === current_width) {
+                return window.dash_clientside.no_update;
+            }
+            return graph.offsetWidth;
+        }
+        """,
+        Output(store_id, 'data'),
+        [trigger],
+        [State(store_id, 'data')]
+    )
+
+# builds the graph of a sensor path on each of the given days (at most n_cols of them), one subplot per day
+# every trace is downsampled to about one point per pixel of its subplot, so the figure stays small no matter how much data there is
+# if zoom is given (see parseZoom) only that part of each day is graphed, so zooming in shows every point again
+# when the graphed time span has more minutes than the plot has pixels, the coarsest rollup that still fills the plot is graphed
+# instead of the raw measurements (see data_rollups): the mean of each bucket, or its minimum and maximum when downsampling
+# with 'minmax' so no peak is averaged away, rollups are never used when every point is asked for (downsampling 'none')
+# progress is called with a description of each step as it starts, it can raise to stop building the graph
+def buildSensorFigure(current_node : str, current_subsystem : str, current_sensor : str, current_parameter : str, days : list, processing_settings : list, downsampling : str = 'lttb', width : int = None, zoom : tuple = None, progress = None):
+    n_cols = 2
+
+    # points per trace
+    max_points = (width or DEFAULT_GRAPH_WIDTH) // n_cols
+    if downsampling == 'none':
+        downsampling = None
+
+    if progress is not None:
+        progress("Finding the measurements")
+    rollup = None if downsampling is None else pickRollup(ONE_DAY if zoom is None else zoom[1] - zoom[0], max_points)
+    source = getData() if rollup is None else rollup[1]
+
+    data = filterByNodeId(source, current_node)
+    graph_data = filterBySensorPath(data, 
+                                    subsystem = current_subsystem,
+                                    sensor = current_sensor,
+                                    parameter = current_parameter)
+
+    # get data
+    days = set(days) # prevent duplicate values from breaking stuff
+
+    # create figure
+    fig = make_subplots(1, n_cols)
+    col = 0
+    # traces
+    # make a trace for each day
+    for day in days:
+        current_dotw = DAYS_OF_THE_WEEK[day]
+        if progress is not None:
+            progress("Graphing {} ({} of {})".format(current_dotw, col + 1, min(len(days), n_cols)))
+        day_data = filterByDay(graph_data, datetime(month=8, day=day, year=2020).date())
+
+        if rollup is None:
+            values = day_data['value_hrf']
+            if 'moving_average' in processing_settings:
+                values = values.rolling(10).mean()
+        elif 'moving_average' in processing_settings:
+            values = rollupMovingAverage(day_data)
+        elif downsampling == 'minmax':
+            # graph every bucket twice, at its minimum and then at its maximum
+            values = pd.Series(day_data[['min', 'max']].to_numpy().ravel())
+            day_data = day_data.iloc[np.repeat(np.arange(len(day_data)), 2)]
+        else:
+            values = day_data['mean']
+
+        # the moving average is taken over the whole day, so only cut the day down to the zoomed range afterwards
+        # (a sensor path is sorted by time, so the range is found with a binary search)
+        if zoom is not None:
+            timestamps = day_data['timestamp'].to_numpy()
+            day_start = pd.Timestamp(datetime(month=8, day=day, year=2020))
+            first = timestamps.searchsorted((day_start + zoom[0]).to_datetime64(), side='left')
+            last = timestamps.searchsorted((day_start + zoom[1]).to_datetime64(), side='right')
+            day_data = day_data.iloc[first:last]
+            values = values.iloc[first:last]
+
+        # only send the points that will be visible at this width
+        kept = downsample(day_data['timestamp'].to_numpy().view('int64'), values.to_numpy(), max_points, downsampling)
+        times = (REFERENCE_DAY + getTimeOfDay(day_data.iloc[kept])).tolist()
+        values = values.iloc[kept].tolist()
+
+        col += 1
+
+        if 'moving_average' in processing_settings:
+            trace = go.Scattergl(
+                x = times,
+                x0 = time(hour=0, minute=0, second=0),
+                #dx = time(minute = 1),
+                y = values,
+                name = current_dotw,
+                showlegend=True,
+                mode="lines",
+                marker={
+                    "color" : DAY_COLORS[day]
+                }
+            )
+            fig.add_trace(trace, row = 1, col = col)
+        else:
+            trace = go.Scattergl(
+                x = times,
+                x0 = time(hour=0, minute=0, second=0),
+                #dx = time(minute = 1),
+                y = values,
+                name = current_dotw,
+                showlegend=True,
+                mode="markers",
+                marker={
+                    'color' : DAY_COLORS[day]
+                }
+            )
+            fig.add_trace(trace, row = 1, col = col)
+
+        if col == n_cols:
+            break
+
+    
+    fig.update_layout(
+        title_text=current_parameter + " Over Time",
+        xaxis_title="Time (12:00 am to 11:59 pm)",
+        yaxis_title=current_parameter
+    )
+
+    # the days share one time axis, zooming into one zooms into all of them
+    fig.update_xaxes(matches='x', tickformat='%H:%M', hoverformat='%H:%M:%S')
+    if zoom is not None:
+        fig.update_xaxes(range=[REFERENCE_DAY + zoom[0], REFERENCE_DAY + zoom[1]])
+
+    return fig
+
+# returns the key the sensor graph of a selection is cached under
+# the selection is normalized, so selections that give the same figure (e.g. the same days in another order) share it
+def sensorFigureKey(current_node : str, current_subsystem : str, current_sensor : str, current_parameter : str, days : list, processing_settings : list, downsampling : str = 'lttb', width : int = None, zoom : tuple = None) -> tuple:
+    return (
+        current_node, current_subsystem, current_sensor, current_parameter,
+        tuple(sorted(set(days))),
+        'moving_average' in processing_settings,
+        None if downsampling == 'none' else downsampling,
+        width or DEFAULT_GRAPH_WIDTH,
+        zoom
+    )
+
+# returns the json of the sensor graph cached under key, from FIGURE_CACHE or the result cache shared by every process
+# returns None if it was not built before (on any page)
+def lookupSensorFigure(key : tuple) -> str:
+    version = getDataVersion()
+    figure_json = FIGURE_CACHE.get(key, version)
+    if figure_json is None:
+        shared = getResult('sensor_graph', key)
+        if shared is not None:
+            figure_json = shared.decode()
+            FIGURE_CACHE.put(key, version, figure_json)
+    return figure_json
+
+def storeSensorFigure(key : tuple, figure_json : str):
+    FIGURE_CACHE.put(key, getDataVersion(), figure_json)
+    putResult('sensor_graph', key, figure_json.encode())
+
+# builds the sensor graph of a selection as json, reporting its progress if it is run as a job (see DashApp.jobs)
+def buildSensorFigureJson(*selection) -> str:
+    return buildSensorFigure(*selection, progress=reportProgress).to_json()
+
+# shares how the job building the sensor graph cached under key went with every process serving the app, as soon as it is done
+# (rather than when the page checks on it), since the page may check on it in another process (see fetchSensorFigure)
+def shareSensorFigure(key : tuple, job_id : str, figure_json : str, error : Exception):
+    if error is not None:
+        putResult('sensor_graph_failure', (job_id,), str(error).encode())
+    else:
+        storeSensorFigure(key, figure_json)
+
+# starts building the sensor graph of a selection as a job (see DashApp.jobs), returns what the page keeps in its job store
+# every graph a page asks for is submitted to the same group, so the job for a selection the user already changed is cancelled
+# (even if the page has not heard back about it yet), if it is being built right here PreventUpdate is raised
+def submitSensorFigure(previous_job : dict, *selection) -> dict:
+    session = uuid.uuid4().hex if previous_job is None else previous_job['session']
+
+    key = sensorFigureKey(*selection)
+    figure_json = lookupSensorFigure(key)
+    try:
+        if figure_json is not None:
+            job_id = finishedJob(json.loads(figure_json), group=session)
+        else:
+            job_id = submitJob(buildSensorFigureJson, *selection, group=session, finished=functools.partial(shareSensorFigure, key))
+    except JobCancelled:
+        raise dash.exceptions.PreventUpdate() # the page already asked for another graph
+
+    # the selection is kept too, so another process serving the app can look the graph up if it is asked about the job
+    selection = list(selection)
+    if selection[-1] is not None:
+        selection[-1] = [str(selection[-1][0]), str(selection[-1][1])] # the zoom range
+    return {'job' : job_id, 'session' : session, 'selection' : selection}
+
+# checks on the job in a page's job store (see submitSensorFigure), returns like DashApp.jobs.pollJob:
+# ('done', figure), ('running', progress), ('failed', error) or ('cancelled', None)
+def fetchSensorFigure(job : dict):
+    selection = list(job['selection'])
+    if selection[-1] is not None:
+        selection[-1] = (pd.Timedelta(selection[-1][0]), pd.Timedelta(selection[-1][1]))
+
+    status = pollJob(job['job'])
+    if status is None: # the job was submitted to another process serving the app
+        return fetchSharedSensorFigure(job['job'], selection)
+    elif status[0] == 'running':
+        return 'running', status[1] or "Waiting for a worker"
+    elif status[0] != 'done':
+        return status
+
+    figure = status[1]
+    if isinstance(figure, str): # built by the job (which shared it, see shareSensorFigure), rather than taken from the caches
+        figure = json.loads(figure)
+    return 'done', figure
+
+# checks on a job another process serving the app submitted, through what it shares once the job is done (see shareSensorFigure)
+# the graph is never built here, it is 'running' until the other process shares it
+# without a result cache nothing is shared, so the job is treated as 'cancelled' and the page has to ask for the graph again
+def fetchSharedSensorFigure(job_id : str, selection : list):
+    if not sharesResults():
+        return 'cancelled', None
+
+    figure_json = lookupSensorFigure(sensorFigureKey(*selection))
+    if figure_json is not None:
+        return 'done', json.loads(figure_json)
+    error = getResult('sensor_graph_failure', (job_id,))
+    if error is not None:
+        return 'failed', error.decode()
+    return 'running', "Being built by another worker"
+
+# shows the sensor graph of a page once the job in its job store is done, checking on the job every GRAPH_POLL_INTERVAL until then
+# (and showing its progress in progress_id)
+def registerGraphJobCallback(graph_id : str, job_store_id : str, poll_id : str, progress_id : str):
+    @app.callback(
+        [
+            Output(graph_id, 'figure'),
+            Output(poll_id, 'disabled'),
+            Output(progress_id, 'children')
+        ],
+        [
+            Input(job_store_id, 'data'),
+            Input(poll_id, 'n_intervals')
+        ]
+    )
+    def fetch_graph(job, n_intervals):
+        if job is None:
+            raise dash.exceptions.PreventUpdate()
+
+        # polling stops once the job is no longer running, whether or not it built the graph
+        status, value = fetchSensorFigure(job)
+        if status == 'running':
+            return dash.no_update, False, value + "..."
+        elif status == 'failed':
+            print("Building the sensor graph of {} failed: {!r}".format(job['selection'], value))
+            return dash.no_update, True, "Could not build the graph: {}".format(value)
+        elif status == 'cancelled':
+            return dash.no_update, True, "The graph is no longer being built, change the selection to build it again"
+        return value, True, ""
\ No newline at end of file
@@ -2,59 +2,79 @@
 # There is a drop-down menu which allows users to select the graph 
 # Each graph's callback functions are defined in the student files
 
-import dash
+import importlib
+
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output, State
-
-import plotly.graph_objects as go
+from dash.dependencies import Input, Output
 
 from .app import app
+from .warmup import isWarmingUp, warmupStatus
+from profiling import profiled
+
+# every page of the app: the value of its option in main_dropdown, its label and its module in DashApp.pages
+# to add a page, add it here and give its module a getLayout function
+PAGES = [
+    ('Home', 'Home', 'Home'),
+    ('Q1', 'Question 1', 'Q1'),
+    ('Q2', 'Question 2', 'Q2'),
+    ('Q3', 'Question 3', 'Q3')
+]
 
-from .pages import Home, Q1, Q2, Q3 # import other page layouts
+# the page modules are imported up front, since dash only sends the browser the callbacks that exist when it first loads
+# importing a page only registers its callbacks though, its layout is built the first time main_dropdown_callback routes to it
+page_modules = {value : importlib.import_module('.pages.' + module, __package__) for value, label, module in PAGES}
 
 dropdown_opts = [
     {
-        'label' : 'Home',
-        'value' : 'Home'
-    },
-    {
-        'label' : 'Question 1',
-        'value' : 'Q1'
-    },
-    {
-        'label' : 'Question 2',
-        'value' : 'Q2'
-    },
-    {
-        'label' : 'Question 3',
-        'value' : 'Q3'
+        'label' : label,
+        'value' : value
     }
+    for value, label, module in PAGES
 ]
 
-app.layout = html.Div(
-    children=[
-                html.H1("CS 395 Project 1 Analysis Questions"),
-                html.H2("Change Question and Question Data Here: "),
-                dcc.Dropdown(id="main_dropdown", options=dropdown_opts, value="Home"),
-                html.Div(id="content-div")
-            ]
+# the layout is built for every visitor, so visitors that arrive while the app is still warming up get the loading page
+# (the interval polls the warm up until it is done, see warmup_callback)
+@profiled("Building the root layout")
+def serveLayout():
+    return html.Div(
+        children=[
+                    html.H1("CS 395 Project 1 Analysis Questions"),
+                    html.H2("Change Question and Question Data Here: "),
+                    dcc.Dropdown(id="main_dropdown", options=dropdown_opts, value="Home"),
+                    html.Div(id="warmup_status"),
+                    dcc.Interval(id="warmup_interval", interval=1000, disabled=not isWarmingUp()),
+                    html.Div(id="content-div")
+                ]
+    )
+
+app.layout = serveLayout
+
+@app.callback(
+    [
+        Output('warmup_interval', 'disabled'),
+        Output('warmup_status', 'children')
+    ],
+    [
+        Input('warmup_interval', 'n_intervals')
+    ]
 )
+def warmup_callback(n_intervals):
+    if isWarmingUp():
+        return (False, html.H3(warmupStatus()))
+    return (True, None) # stopping the interval shows the selected page (see main_dropdown_callback)
 
 @app.callback(
     Output('content-div', 'children'),
     [
-        Input('main_dropdown', 'value')
+        Input('main_dropdown', 'value'),
+        Input('warmup_interval', 'disabled')
     ]
 )
-def main_dropdown_callback(value):
-    if value == 'Home':
-        return Home.layout
-    elif value == 'Q1':
-        return Q1.layout
-    elif value == 'Q2':
-        return Q2.layout
-    elif value == 'Q3':
-        return Q3.layout
-    else:
-        return html.H1("Invalid option selected")
\ No newline at end of file
+def main_dropdown_callback(value, warming_up_done):
+    if isWarmingUp():
+        return html.Div("The data is still loading, the page will show up here once it is ready.")
+
+    if value not in page_modules:
+        return html.H1("Invalid option selected")
+    return page_modules[value].getLayout() # built the first time the page is opened, then kept
\ No newline at end of file
@@ -0,0 +1,261 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from data_filters import takeScanned
+from data_parser import getData
+from .metrics import JOB_ROWS
+
+# how many processes the expensive callbacks (see submitJob) are run in, 0 runs them in the thread handling the request
+JOB_WORKERS = 0
+
+# keyword arguments to data_parser.getData, so every worker process opens the data the same way the app does (see configureJobs)
+JOB_DATA_OPTIONS = dict()
+
+# every job has a cancellation flag shared with the workers, the flag of a job is its id modulo this
+# so this many jobs can be in flight before two of them share a flag
+JOB_SLOTS = 1024
+
+# finished jobs are kept, so a page that checks on one again (e.g. a poll that crossed the one that fetched it) gets the same answer,
+# they are forgotten once there are more than this many
+MAX_FINISHED_JOBS = 256
+
+# how many groups of jobs (see submitJob) are remembered, the oldest ones are forgotten first
+MAX_JOB_GROUPS = 1024
+
+JOB_POOL = None # the worker processes, started by the first job
+JOB_PROGRESS = None # queue the workers send (job id, progress) through
+JOB_CANCELLED = None # the cancellation flags
+JOBS = dict() # job id -> Job, of every job that was submitted and has not been cancelled or forgotten
+JOB_GROUPS = OrderedDict() # group -> id of the last job submitted in it
+JOB_IDS = itertools.count(1)
+JOB_PREFIX = uuid.uuid4().hex[:12] # the ids of the jobs of each process serving the app start with their own prefix, so they never clash
+JOB_LOCK = threading.Lock()
+
+# set in each worker process, see initWorker
+WORKER_JOB = None # id of the job the worker is running
+WORKER_SLOT = None # and its cancellation flag
+WORKER_PROGRESS = None
+WORKER_CANCELLED = None
+
+INLINE_JOB = threading.local() # the job each thread is running, when jobs are not run in worker processes
+
+# raised inside a job that was cancelled while it was running (see reportProgress)
+class JobCancelled(Exception):
+    pass
+
+# a job that was submitted, future is None unless it was sent to a worker process
+class Job:
+    def __init__(self, job_id : str, future = None, result = None, done : bool = False):
+        self.id = job_id
+        self.future = future
+        self.result = result
+        self.done = done # for jobs that were not sent to a worker
+        self.cancelled = False
+        self.progress = None # what the job last reported it was doing
+
+    def isDone(self) -> bool:
+        return self.done if self.future is None else self.future.done()
+
+# runs the expensive callbacks in a pool of worker processes, or in the thread handling the request if workers is 0
+# data_options are given to data_parser.getData in every worker, so a worker opens the same data as the app
+def configureJobs(workers : int, data_options : dict = None):
+    global JOB_WORKERS, JOB_DATA_OPTIONS
+    JOB_WORKERS = workers
+    JOB_DATA_OPTIONS = dict(data_options or dict())
+
+# whether jobs are run in worker processes
+def runsJobsInWorkers() -> bool:
+    return JOB_WORKERS > 0
+
+# starts the worker processes (once), along with a thread that records the progress they report
+# the workers are spawned rather than forked, since forking a process that is serving requests on several threads is not safe
+def startJobPool() -> ProcessPoolExecutor:
+    global JOB_POOL, JOB_PROGRESS, JOB_CANCELLED
+    with JOB_LOCK:
+        if JOB_POOL is None:
+            context = multiprocessing.get_context('spawn')
+            JOB_PROGRESS = context.Queue()
+            JOB_CANCELLED = context.Array('b', JOB_SLOTS, lock=False)
+            JOB_POOL = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=context, initializer=initWorker,
+                                           initargs=(JOB_PROGRESS, JOB_CANCELLED, JOB_DATA_OPTIONS))
+            threading.Thread(target=recordProgress, name='job-progress', daemon=True).start()
+    return JOB_POOL
+
+# records the progress the workers report, until the process exits
+def recordProgress():
+    while True:
+        job_id, progress = JOB_PROGRESS.get()
+        with JOB_LOCK:
+            if job_id in JOBS:
+                JOBS[job_id].progress = progress
+
+# run in each worker process when it starts: loads the data, so the first job it runs does not have to
+def initWorker(progress_queue, cancelled, data_options : dict):
+    global WORKER_PROGRESS, WORKER_CANCELLED
+    WORKER_PROGRESS = progress_queue
+    WORKER_CANCELLED = cancelled
+    getData(**data_options)
+
+# run in a worker process, runs a job and returns its result along with the number of rows of the data it scanned
+# (the filters count them in the thread that runs them, see data_filters.countScanned, so they are sent back to be recorded)
+def runJob(job_id : str, slot : int, function, args : tuple):
+    global WORKER_JOB, WORKER_SLOT
+    WORKER_JOB, WORKER_SLOT = job_id, slot
+    takeScanned() # start counting from 0
+    try:
+        return function(*args), takeScanned()
+    finally:
+        WORKER_JOB, WORKER_SLOT = None, None
+
+# called by a job as it goes, to report what it is doing to the page waiting for it (see pollJob)
+# raises JobCancelled if the job was cancelled, so it stops as soon as it can
+# (progress is only reported when the job is run in a worker process, the page can not check on a job run while handling its request)
+def reportProgress(progress : str):
+    if WORKER_JOB is None:
+        job = getattr(INLINE_JOB, 'job', None)
+        if job is not None and job.cancelled:
+            raise JobCancelled()
+        return
+    if WORKER_CANCELLED[WORKER_SLOT]:
+        raise JobCancelled()
+    WORKER_PROGRESS.put((WORKER_JOB, progress))
+
+# returns a new job id, and the cancellation flag of the job, call with the lock held
+def nextJob():
+    number = next(JOB_IDS)
+    return '{}-{}'.format(JOB_PREFIX, number), number % JOB_SLOTS
+
+# returns the cancellation flag of a job
+def jobSlot(job_id : str) -> int:
+    return int(job_id.rsplit('-', 1)[1]) % JOB_SLOTS
+
+# adds a job to a group (if it is given), cancelling the job submitted to the group before it
+# and forgets the oldest finished jobs if too many were never fetched, call with the lock held
+def addJob(job : Job, group : str = None) -> str:
+    JOBS[job.id] = job
+    if group is not None:
+        previous = JOB_GROUPS.pop(group, None)
+        if previous is not None:
+            stopJob(previous)
+        JOB_GROUPS[group] = job.id
+        while len(JOB_GROUPS) > MAX_JOB_GROUPS:
+            JOB_GROUPS.popitem(last=False)
+
+    finished = [job_id for job_id, job in JOBS.items() if job.isDone()]
+    for job_id in finished[:len(finished) - MAX_FINISHED_JOBS]:
+        del JOBS[job_id]
+    return job.id
+
+# runs function(*args) as a job and returns its id, to check on it with pollJob
+# if jobs are run in worker processes, this returns right away, function and args are sent to a worker,
+# so function has to be defined at the top level of a module
+# otherwise function is run right here, and the job is finished by the time this returns
+# submitting a job to a group (e.g. everything one page asks for) cancels the job submitted to the group before it,
+# if that job is cancelled while it is run right here (see reportProgress), JobCancelled is raised
+# finished is called in this process as finished(job_id, result, error) once the job is done, whether or not anything checks on it,
+# e.g. to share the result with other processes: error is None unless the job raised in a worker process (run right here, the
+# error is raised to the caller instead), it is not called for a job that was cancelled
+def submitJob(function, *args, group : str = None, finished = None) -> str:
+    if not runsJobsInWorkers():
+        return runInline(function, args, group, finished)
+
+    pool = startJobPool()
+    with JOB_LOCK:
+        job_id, slot = nextJob()
+        JOB_CANCELLED[slot] = 0
+        future = pool.submit(runJob, job_id, slot, function, args)
+        addJob(Job(job_id, future), group)
+
+    future.add_done_callback(lambda future: reportFinished(job_id, function, future, finished))
+    return job_id
+
+# once the future of a job run in a worker process is done (see submitJob), records the rows it scanned
+# and calls its finished callback
+def reportFinished(job_id : str, function, future, finished):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is None:
+        JOB_ROWS.observe({'job' : function.__name__}, future.result()[1])
+    if finished is None or isinstance(error, JobCancelled):
+        return
+    finished(job_id, None if error is not None else future.result()[0], error)
+
+# runs a job in the thread that submitted it
+def runInline(function, args : tuple, group : str, finished = None) -> str:
+    with JOB_LOCK:
+        job = Job(nextJob()[0])
+        addJob(job, group)
+
+    INLINE_JOB.job = job
+    try:
+        result = function(*args)
+    except BaseException:
+        with JOB_LOCK:
+            JOBS.pop(job.id, None)
+        raise
+    finally:
+        INLINE_JOB.job = None
+
+    with JOB_LOCK:
+        job.result = result
+        job.done = True
+    if finished is not None:
+        finished(job.id, result, None)
+    return job.id
+
+# returns the id of a job that is already finished with the given result, for when there was nothing left to do
+def finishedJob(result, group : str = None) -> str:
+    with JOB_LOCK:
+        return addJob(Job(nextJob()[0], result=result, done=True), group)
+
+# cancels a job: a job that has not started is never run, a running one stops the next time it reports its progress
+# call with the lock held
+def stopJob(job_id : str):
+    job = JOBS.pop(job_id, None)
+    if job is None:
+        return
+    job.cancelled = True
+    if job.future is not None and not job.future.cancel():
+        JOB_CANCELLED[jobSlot(job_id)] = 1
+
+# forgets the jobs and worker processes of the process this one was forked from, and numbers its own jobs with a prefix of its own
+# run in every forked process (e.g. each worker gunicorn forks from the process that loaded the app, see DashApp.serving),
+# otherwise every worker would hand out the same job ids, and a page checking on its job in another worker would get that worker's job
+def resetJobs():
+    global JOB_POOL, JOB_PROGRESS, JOB_CANCELLED, JOBS, JOB_GROUPS, JOB_IDS, JOB_PREFIX, JOB_LOCK
+    JOB_POOL, JOB_PROGRESS, JOB_CANCELLED = None, None, None
+    JOBS = dict()
+    JOB_GROUPS = OrderedDict()
+    JOB_IDS = itertools.count(1)
+    JOB_PREFIX = uuid.uuid4().hex[:12]
+    JOB_LOCK = threading.Lock() # it may have been held by another thread when the process was forked
+
+if hasattr(os, 'register_at_fork'): # not on windows, which can not fork
+    os.register_at_fork(after_in_child=resetJobs)
+
+# checks on a job, returns:
+#   ('done', result) once it is finished
+#   ('failed', error) if it raised error
+#   ('running', progress) while it is waiting or running, progress is what it last reported (None if it has not started)
+#   ('cancelled', None) if the job was cancelled (or forgotten, see MAX_FINISHED_JOBS)
+#   None if the job was submitted to another process serving the app
+def pollJob(job_id : str):
+    with JOB_LOCK:
+        job = JOBS.get(job_id)
+        if job is None:
+            return ('cancelled', None) if job_id.startswith(JOB_PREFIX + '-') else None
+        if not job.isDone():
+            return ('running', job.progress)
+
+    if job.future is None:
+        return ('done', job.result)
+    error = job.future.exception()
+    if error is not None:
+        return ('failed', error)
+    return ('done', job.future.result()[0]) # without the rows it scanned (see runJob)
\ No newline at end of file
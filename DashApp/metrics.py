@@ -0,0 +1,150 @@
+import functools
+import threading
+import time
+
+import dash
+import flask
+import plotly.graph_objects as go
+
+from data_filters import takeScanned
+
+# the upper bounds of the buckets of each histogram (every histogram also has a +Inf bucket)
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+ROWS_BUCKETS = [0, 100, 1000, 10000, 100000, 1000000, 10000000]
+POINTS_BUCKETS = [0, 100, 500, 1000, 5000, 10000, 50000, 100000]
+BYTES_BUCKETS = [1000, 10000, 100000, 1000000, 10000000]
+
+# a prometheus style histogram: how many observations fell into each bucket, per set of label values
+class Histogram:
+    def __init__(self, name : str, description : str, buckets : list):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = dict() # label values -> (bucket counts, sum, count)
+        self.lock = threading.Lock()
+
+    def observe(self, labels : dict, value : float):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total, count = self.series.get(key, ([0] * len(self.buckets), 0, 0))
+            counts = [n + (value <= bound) for n, bound in zip(counts, self.buckets)]
+            self.series[key] = (counts, total + value, count + 1)
+
+    # returns the histogram in the prometheus text format
+    def render(self) -> list:
+        lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} histogram".format(self.name)]
+        with self.lock:
+            series = sorted(self.series.items())
+        for key, (counts, total, count) in series:
+            labels = ','.join('{}="{}"'.format(name, value) for name, value in key)
+            for bound, n in zip(self.buckets, counts):
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, labels, bound, n))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(self.name, labels, count))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, labels, total))
+            lines.append('{}_count{{{}}} {}'.format(self.name, labels, count))
+        return lines
+
+# a prometheus style counter, per set of label values
+class Counter:
+    def __init__(self, name : str, description : str):
+        self.name = name
+        self.description = description
+        self.series = dict()
+        self.lock = threading.Lock()
+
+    def increment(self, labels : dict, amount : float = 1):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} counter".format(self.name)]
+        with self.lock:
+            series = sorted(self.series.items())
+        for key, value in series:
+            lines.append('{}{{{}}} {}'.format(self.name, ','.join('{}="{}"'.format(name, value) for name, value in key), value))
+        return lines
+
+CALLBACK_CALLS = Counter('dash_callback_calls_total', "Callback invocations, by outcome (ok, prevented or error).")
+CALLBACK_DURATION = Histogram('dash_callback_duration_seconds', "Wall time spent in the callback function.", DURATION_BUCKETS)
+CALLBACK_ROWS = Histogram('dash_callback_rows_scanned', "Rows of the data the filters looked at during the callback.", ROWS_BUCKETS)
+CALLBACK_POINTS = Histogram('dash_callback_points_returned', "Data points in the figures the callback returned.", POINTS_BUCKETS)
+CALLBACK_BYTES = Histogram('dash_callback_response_bytes', "Size of the JSON response sent back for the callback.", BYTES_BUCKETS)
+JOB_ROWS = Histogram('dash_job_rows_scanned', "Rows of the data the filters looked at during a job run in a worker process, by the function it ran.", ROWS_BUCKETS)
+CACHE_REQUESTS = Counter('dash_cache_requests_total', "Lookups in the result caches, by cache and result (hit, miss or error).")
+METRICS = [CALLBACK_CALLS, CALLBACK_DURATION, CALLBACK_ROWS, CALLBACK_POINTS, CALLBACK_BYTES, JOB_ROWS, CACHE_REQUESTS]
+
+# returns the number of data points in the figures in a callback's return value (0 if it did not return any figures)
+def countPoints(output) -> int:
+    if isinstance(output, (list, tuple)):
+        return sum(countPoints(item) for item in output)
+    elif isinstance(output, go.Figure):
+        traces = output.data
+    elif isinstance(output, dict) and isinstance(output.get('data'), (list, tuple)):
+        traces = output['data']
+    else:
+        return 0
+
+    n_points = 0
+    for trace in traces:
+        for key in ['x', 'lat', 'values']:
+            values = trace[key] if key in trace else None
+            if values is not None:
+                n_points += len(values)
+                break
+    return n_points
+
+# names a callback by its function and its (first) output, since several callbacks share a function name
+def callbackLabels(function, output) -> dict:
+    if isinstance(output, (list, tuple)):
+        output = output[0]
+    return {'callback' : function.__name__, 'output' : '{}.{}'.format(output.component_id, output.component_property)}
+
+# wraps a callback function so every call records its wall time, the rows it scanned and the points it returned
+def instrumentCallback(function, labels : dict):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        takeScanned() # start counting from 0
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            output = function(*args, **kwargs)
+            outcome = 'ok'
+            CALLBACK_POINTS.observe(labels, countPoints(output))
+            if flask.has_request_context():
+                flask.g.callback_labels = labels # the response size is recorded once dash has serialized the output
+            return output
+        except dash.exceptions.PreventUpdate:
+            outcome = 'prevented'
+            raise
+        finally:
+            CALLBACK_DURATION.observe(labels, time.perf_counter() - start)
+            CALLBACK_ROWS.observe(labels, takeScanned())
+            CALLBACK_CALLS.increment(dict(labels, outcome=outcome))
+    return wrapper
+
+# records the size of the response to every callback request
+def recordResponseSize(response):
+    labels = getattr(flask.g, 'callback_labels', None)
+    if labels is not None:
+        CALLBACK_BYTES.observe(labels, response.calculate_content_length() or len(response.get_data()))
+    return response
+
+# returns every metric in the prometheus text format
+def renderMetrics() -> str:
+    lines = list()
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# replaces app.callback so every callback registered from now on is instrumented, and serves the metrics at /metrics
+def instrumentApp(app : dash.Dash):
+    register_callback = app.callback
+
+    def callback(output, *args, **kwargs):
+        register = register_callback(output, *args, **kwargs)
+        return lambda function : register(instrumentCallback(function, callbackLabels(function, output)))
+
+    app.callback = callback
+    app.server.after_request(recordResponseSize)
+    app.server.add_url_rule('/metrics', 'metrics', lambda : flask.Response(renderMetrics(), mimetype='text/plain; version=0.0.4'))
\ No newline at end of file
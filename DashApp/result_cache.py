@@ -0,0 +1,244 @@
+import functools
+import hashlib
+import json
+import os
+import os.path as path
+import socket
+import threading
+import time
+from urllib.parse import urlparse, unquote
+
+import plotly
+
+from data_parser import getDataVersion
+from .metrics import CACHE_REQUESTS
+
+# set this environment variable to share callback results between every process serving the app (see openResultCache for the urls)
+RESULT_CACHE_ENV = 'AOT_RESULT_CACHE'
+
+# how long (in seconds) a result is kept, results are also replaced whenever the data changes, since its version is part of the key
+RESULT_CACHE_TTL = 60 * 60
+
+# where the disk cache is stored if the url does not say
+RESULT_CACHE_PATH = 'data/result_cache'
+
+RESULT_CACHE = None # the backend the results are shared through, None if they are not shared (see configureResultCache)
+
+# stores each result in its own file in a directory, for when every process serving the app is on the same machine
+# files are written to a temporary file and renamed, so a process never reads a result another one is still writing
+class DiskCache:
+    name = 'disk'
+
+    def __init__(self, directory : str = RESULT_CACHE_PATH, ttl : float = RESULT_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.n_puts = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def keyPath(self, key : str) -> str:
+        return path.join(self.directory, key.replace(':', '_') + '.json')
+
+    # returns the result stored under key, or None if there is none (or it has expired)
+    def get(self, key : str) -> bytes:
+        filepath = self.keyPath(key)
+        try:
+            if path.getmtime(filepath) + self.ttl < time.time():
+                os.remove(filepath)
+                return None
+            with open(filepath, 'rb') as f:
+                return f.read()
+        except FileNotFoundError: # it was never stored, or another process just removed it
+            return None
+
+    def put(self, key : str, value : bytes):
+        tmp_path = '{}.{}.{}.tmp'.format(self.keyPath(key), os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, self.keyPath(key))
+
+        # every so often, remove the results that have expired (results of older versions of the data expire like any other)
+        self.n_puts += 1
+        if self.n_puts % 100 == 0:
+            self.removeExpired()
+
+    def removeExpired(self):
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+# the redis error a command was answered with
+class RedisError(Exception):
+    pass
+
+# stores the results in redis (or anything that speaks its protocol), for when the processes are spread over several machines
+# this only needs GET and SET, so it talks the protocol itself instead of depending on a redis client
+# every thread gets its own connection, since the callbacks are run by several threads at once
+class RedisCache:
+    name = 'redis'
+
+    def __init__(self, host : str = 'localhost', port : int = 6379, db : int = 0, password : str = None, ttl : float = RESULT_CACHE_TTL, timeout : float = 1.0):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.ttl = ttl
+        self.timeout = timeout
+        self.local = threading.local()
+
+    # returns this thread's connection and its reader, connecting (and logging in and selecting the database) if it is not connected yet
+    # a connection is only kept once it is logged in, so a login that failed is tried again by the next command
+    def connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            connection = socket.create_connection(self.address, timeout=self.timeout)
+            reader = connection.makefile('rb')
+            try:
+                if self.password is not None:
+                    self.request(connection, reader, 'AUTH', self.password)
+                if self.db != 0:
+                    self.request(connection, reader, 'SELECT', self.db)
+            except BaseException:
+                reader.close()
+                connection.close()
+                raise
+            self.local.connection, self.local.reader = connection, reader
+        return self.local.connection, self.local.reader
+
+    def disconnect(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            self.local.reader.close()
+            connection.close()
+        self.local.connection, self.local.reader = None, None
+
+    # sends a command and returns its reply, reconnecting on the next command if the connection broke
+    def command(self, *args):
+        try:
+            return self.request(*self.connection(), *args)
+        except OSError:
+            self.disconnect()
+            raise
+
+    # sends a command over a connection and returns its reply
+    def request(self, connection, reader, *args):
+        message = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            message.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+
+        connection.sendall(b''.join(message))
+        return self.readReply(reader)
+
+    # reads one reply in the redis protocol: +simple string, -error, :integer, $bulk string or *array
+    def readReply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Redis closed the connection")
+        kind, rest = line[:1], line[1:-2]
+
+        if kind == b'+':
+            return rest
+        elif kind == b'-':
+            raise RedisError(rest.decode())
+        elif kind == b':':
+            return int(rest)
+        elif kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            value = reader.read(length + 2)
+            return value[:-2]
+        elif kind == b'*':
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self.readReply(reader) for i in range(length)]
+        raise RedisError("Unexpected reply from redis: {}".format(line))
+
+    def get(self, key : str) -> bytes:
+        return self.command('GET', key)
+
+    def put(self, key : str, value : bytes):
+        self.command('SET', key, value, 'EX', int(self.ttl))
+
+# opens the backend a url names:
+#   disk:PATH (or just disk, for RESULT_CACHE_PATH) for a DiskCache
+#   redis://[:PASSWORD@]HOST[:PORT][/DB] for a RedisCache
+def openResultCache(url : str, ttl : float = RESULT_CACHE_TTL):
+    if url == 'disk' or url.startswith('disk:'):
+        return DiskCache(url[len('disk:'):] or RESULT_CACHE_PATH, ttl)
+
+    parsed = urlparse(url)
+    if parsed.scheme == 'redis':
+        db = int(parsed.path.strip('/') or 0)
+        password = unquote(parsed.password) if parsed.password else None
+        return RedisCache(parsed.hostname or 'localhost', parsed.port or 6379, db, password, ttl)
+    raise ValueError("Unknown result cache {}, expected disk:PATH or redis://HOST:PORT/DB".format(url))
+
+# shares the results of the callbacks decorated with sharedResult through the backend url names (see openResultCache)
+# None stops sharing them
+def configureResultCache(url : str, ttl : float = RESULT_CACHE_TTL):
+    global RESULT_CACHE
+    RESULT_CACHE = None if url is None else openResultCache(url, ttl)
+
+# whether results are shared with the other processes serving the app
+def sharesResults() -> bool:
+    return RESULT_CACHE is not None
+
+# the key a result is stored under: the name it is shared under, the inputs it was computed from and the version of the data
+# (which only depends on the content of the data, so processes on different machines share results too)
+def resultKey(name : str, args : tuple, kwargs : dict) -> str:
+    inputs = json.dumps([args, kwargs], sort_keys=True, default=str)
+    digest = hashlib.blake2b('{}\0{}\0{}'.format(name, inputs, getDataVersion()).encode(), digest_size=20).hexdigest()
+    return 'aot:{}:{}'.format(name, digest)
+
+# returns the result shared under name for the given inputs, or None if it is not shared yet (or results are not shared at all)
+# if the cache can not be reached this returns None as well, so the app keeps working without it
+def getResult(name : str, args : tuple, kwargs : dict = None) -> bytes:
+    cache = RESULT_CACHE
+    if cache is None:
+        return None
+
+    labels = {'cache' : 'result_' + cache.name}
+    try:
+        value = cache.get(resultKey(name, args, kwargs or dict()))
+    except (OSError, RedisError) as e:
+        print("Could not read from the {} result cache: {}".format(cache.name, e))
+        CACHE_REQUESTS.increment(dict(labels, result='error'))
+        return None
+
+    CACHE_REQUESTS.increment(dict(labels, result='miss' if value is None else 'hit'))
+    return value
+
+# shares a result computed from the given inputs under name
+def putResult(name : str, args : tuple, value : bytes, kwargs : dict = None):
+    cache = RESULT_CACHE
+    if cache is None:
+        return
+
+    try:
+        cache.put(resultKey(name, args, kwargs or dict()), value)
+    except (OSError, RedisError) as e:
+        print("Could not write to the {} result cache: {}".format(cache.name, e))
+
+# decorates a callback so its results are shared through RESULT_CACHE, so a result computed by one process serves all the others
+# callbacks that compute the same thing from the same inputs can be given the same name
+def sharedResult(name : str):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            value = getResult(name, args, kwargs)
+            if value is not None:
+                return json.loads(value)
+
+            result = function(*args, **kwargs) # PreventUpdate and errors are raised before anything is stored
+            putResult(name, args, json.dumps(result, cls=plotly.utils.PlotlyJSONEncoder).encode(), kwargs)
+            return result
+        return wrapper
+    return decorator
+
+if os.environ.get(RESULT_CACHE_ENV):
+    configureResultCache(os.environ[RESULT_CACHE_ENV])
\ No newline at end of file
@@ -0,0 +1,34 @@
+import gc
+import multiprocessing
+
+# how the app is served by gunicorn, unless run.py is told otherwise
+DEFAULT_SERVER_WORKERS = max(2, multiprocessing.cpu_count())
+DEFAULT_SERVER_THREADS = 4
+DEFAULT_SERVER_TIMEOUT = 120 # seconds a worker can spend on a request before it is restarted
+
+# serves a wsgi app (e.g. DashApp.app.server) with gunicorn: workers processes, each one handling threads requests at once
+# the app is loaded in this process before the workers are forked from it, so everything it loaded before this was called
+# (the data, rollups, catalog and page layouts, see run.py) is shared by the workers copy-on-write instead of loaded by each of them
+# (state that has to be each worker's own, like the ids of the jobs in DashApp.jobs, is reset as each worker is forked)
+def serveProduction(server, host : str = '127.0.0.1', port : int = 8050, workers : int = DEFAULT_SERVER_WORKERS, threads : int = DEFAULT_SERVER_THREADS, timeout : int = DEFAULT_SERVER_TIMEOUT):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("Serving the app in production needs gunicorn (pip install gunicorn), which only runs on unix")
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', '{}:{}'.format(host, port))
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('preload_app', True)
+
+        def load(self):
+            return server
+
+    # move everything loaded so far out of reach of the garbage collector, so collections in the workers do not write to
+    # (and so copy) the pages it is on
+    gc.freeze()
+    print("Serving on http://{}:{} with {} workers of {} threads".format(host, port, workers, threads))
+    Application().run()
\ No newline at end of file
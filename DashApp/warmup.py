@@ -0,0 +1,75 @@
+import threading
+import time
+import traceback
+
+from profiling import profilePhase, writeReport
+
+# the work that has to be done before the app can respond quickly: loading the data, building the catalog, building each page...
+# every task is a (description, function) pair, the tasks are run in the order they were registered
+WARMUP_TASKS = list()
+
+WARMUP_STARTED = threading.Event() # set once the tasks have started running in the background
+WARMUP_FINISHED = threading.Event() # set once every task has run (or one of them failed)
+WARMUP_STATUS = {
+    'task' : None, # description of the task that is running
+    'finished' : list(), # (description, seconds) of every task that has finished
+    'error' : None # traceback of the task that failed, if any
+}
+
+# adds a task to the warm up, see WARMUP_TASKS
+def registerWarmup(description : str, function):
+    WARMUP_TASKS.append((description, function))
+
+# runs every registered task in order, stopping at the first one that fails, then writes the startup profile
+# when run in the foreground the error is raised, in the background it is logged and the loading page reports it
+def runWarmup():
+    try:
+        for description, function in WARMUP_TASKS:
+            WARMUP_STATUS['task'] = description
+            start = time.perf_counter()
+            with profilePhase("Warm up: " + description):
+                function()
+            WARMUP_STATUS['finished'].append((description, time.perf_counter() - start))
+    except Exception:
+        WARMUP_STATUS['error'] = traceback.format_exc()
+        if not WARMUP_STARTED.is_set():
+            raise
+        print("Warm up failed while {}:\n{}".format(WARMUP_STATUS['task'].lower(), WARMUP_STATUS['error']))
+    finally:
+        WARMUP_STATUS['task'] = None
+        WARMUP_FINISHED.set()
+        writeReport() # if startup is being profiled (see profiling)
+
+# runs the tasks on a background thread, so the server can start accepting requests (and show a loading page) right away
+def startWarmup() -> threading.Thread:
+    WARMUP_STARTED.set()
+    thread = threading.Thread(target=runWarmup, name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+# whether the tasks are still running in the background
+# (if they were never started in the background, everything is built on demand the first time it is needed)
+def isWarmingUp() -> bool:
+    return WARMUP_STARTED.is_set() and not WARMUP_FINISHED.is_set()
+
+# describes how far along the warm up is, for the loading page
+def warmupStatus() -> str:
+    if WARMUP_STATUS['error'] is not None:
+        return "Loading failed, see the server log for details."
+    elif WARMUP_STATUS['task'] is None:
+        return "Loading..."
+    return "{}... ({} of {} steps done)".format(WARMUP_STATUS['task'], len(WARMUP_STATUS['finished']), len(WARMUP_TASKS))
+
+# returns a function that calls build the first time it is called, and returns the same result from then on
+# a lock makes sure it is only built once, even if the warm up thread and a request ask for it at the same time
+def buildOnce(build):
+    lock = threading.Lock()
+    result = list()
+
+    def get():
+        with lock:
+            if len(result) == 0:
+                result.append(build())
+        return result[0]
+
+    return get
\ No newline at end of file
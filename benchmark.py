@@ -0,0 +1,116 @@
+# benchmarks for the data pipeline, run with: python benchmark.py <benchmark>
+import argparse
+import os.path as path
+import tempfile
+import time
+import pandas as pd
+
+from data_cache import CACHE_FORMATS, openCache
+from data_parser import getData, loadData, memoryReport, PROCESSED_COLUMNS
+from data_filters import getDates, getTimes, lookupIndex, filterByNodeId, filterBySensorPath, filterByDay, PATH_COLUMNS
+
+# converts the compact preprocessed data back to the layout getData used to return
+# (python strings on every row, datetime.date/datetime.time objects and float64 values)
+def legacyFrame(df : pd.DataFrame) -> pd.DataFrame:
+    legacy = dict()
+    legacy['date'] = getDates(df)
+    legacy['time'] = getTimes(df)
+    for column in PROCESSED_COLUMNS:
+        if column == 'timestamp':
+            continue
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            legacy[column] = df[column].astype(object)
+        else:
+            legacy[column] = df[column].astype('float64')
+    return pd.DataFrame(legacy)
+
+# compares the memory used by the compact preprocessed data with the layout it replaced
+def benchmarkMemory(args):
+    df = getData()
+    before = memoryReport(legacyFrame(df))
+    after = memoryReport(df)
+
+    report = pd.DataFrame({'before (MiB)' : before / 2**20, 'after (MiB)' : after / 2**20})
+    print(report.round(2).to_string())
+    print("{} rows, {:.1f}x smaller".format(len(df), before['total'] / after['total']))
+
+# returns the fastest of repeat runs of f, in seconds
+def timeIt(f, repeat : int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+# compares how long each cache format takes to load everything, a projection of the columns, and a node/day query
+# (through loadData, the way the app reads part of the cache without loading the rest)
+def benchmarkCache(args):
+    df = getData()
+    node_id = df['node_id'].iloc[0]
+    day = df['timestamp'].iloc[0].normalize()
+
+    queries = {
+        'everything' : dict(),
+        'timestamp and value_hrf' : dict(columns=['timestamp', 'value_hrf']),
+        'one node' : dict(node_ids=[node_id]),
+        'one day' : dict(start=day, end=day),
+        'one node on one day' : dict(node_ids=[node_id], start=day, end=day)
+    }
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for cache_format in CACHE_FORMATS:
+            cache = openCache(cache_format, path.join(tmp_dir, 'preprocessed_data.' + cache_format))
+            cache.write([df])
+            results[cache_format] = {name : timeIt(lambda: loadData(processed_data_path=cache.path, cache_format=cache_format, **query), args.repeat) for name, query in queries.items()}
+
+    print(pd.DataFrame(results).round(3).to_string())
+    print("(fastest of {} runs, in seconds)".format(args.repeat))
+
+# compares the indexed filters with the mask based filters they fall back to, on node + sensor path + day lookups
+def benchmarkFilters(args):
+    df = getData()
+    unindexed = df.iloc[:] # the same rows, but without an index, so every filter compares every row
+    day = df['timestamp'].min().normalize()
+
+    sensor_paths = [group for group in lookupIndex(df).offsets if len(group) == len(PATH_COLUMNS)]
+    sensor_paths = sensor_paths[::max(1, len(sensor_paths) // args.lookups)][:args.lookups]
+
+    def lookup(frame, sensor_path):
+        node_df = filterByNodeId(frame, sensor_path[0])
+        path_df = filterBySensorPath(node_df, subsystem=sensor_path[1], sensor=sensor_path[2], parameter=sensor_path[3])
+        return filterByDay(path_df, day)
+
+    for sensor_path in sensor_paths:
+        if len(lookup(df, sensor_path)) != len(lookup(unindexed, sensor_path)):
+            raise AssertionError("indexed and mask based filters disagree on {}".format(sensor_path))
+
+    results = dict()
+    for name, frame in [('masks', unindexed), ('indexed', df)]:
+        results[name] = timeIt(lambda: [lookup(frame, sensor_path) for sensor_path in sensor_paths], args.repeat) / len(sensor_paths)
+
+    print(pd.Series(results, name='seconds per lookup').to_string())
+    print("{} rows, {} lookups, {:.0f}x faster".format(len(df), len(sensor_paths), results['masks'] / results['indexed']))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the data pipeline")
+    benchmarks = parser.add_subparsers(dest='benchmark')
+    benchmarks.required = True
+
+    memory = benchmarks.add_parser('memory', help="memory used by the preprocessed data, before and after compacting it")
+    memory.set_defaults(run=benchmarkMemory)
+
+    cache = benchmarks.add_parser('cache', help="load times of each cache format")
+    cache.add_argument('--repeat', type=int, default=3)
+    cache.set_defaults(run=benchmarkCache)
+
+    filters = benchmarks.add_parser('filters', help="node + sensor path + day lookups with and without the index")
+    filters.add_argument('--lookups', type=int, default=20)
+    filters.add_argument('--repeat', type=int, default=3)
+    filters.set_defaults(run=benchmarkFilters)
+
+    args = parser.parse_args()
+    args.run(args)
\ No newline at end of file
@@ -0,0 +1,366 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import os.path as path
+import shutil
+import pyarrow.parquet as pq
+from datetime import date
+from typing import Iterable, List
+from pandas.api.types import union_categoricals
+
+from profiling import profiled
+
+# columns of the preprocessed dataframe, in the order they are stored
+# the date and time of a measurement are views of the timestamp column (see getDates and getTimes in data_filters)
+PROCESSED_COLUMNS = ['timestamp', 'description', 'node_id', 'latitude', 'longitude', 'address', 'subsystem', 'sensor', 'parameter', 'value_hrf']
+
+# the string columns repeat a handful of values on every row, so they are stored as categorical codes
+# each dash worker holds a copy of the preprocessed data, so keeping it small lets us run more of them
+# value_hrf is stored as float32, which keeps about 7 significant digits: every value is rounded to that, so large readings lose
+# their last decimals (a pressure of 98765.4321 is stored as 98765.43, 21.11 stays 21.11)
+COMPACT_DTYPES = {
+    'description' : 'category',
+    'node_id' : 'category',
+    'address' : 'category',
+    'subsystem' : 'category',
+    'sensor' : 'category',
+    'parameter' : 'category',
+    'value_hrf' : 'float32'
+}
+
+# where each cache format is stored by default
+CACHE_PATHS = {
+    'hdf5' : 'data/preprocessed_data.hdf5',
+    'parquet' : 'data/preprocessed_data.parquet'
+}
+
+# where the memory mapped snapshot of the preprocessed data is stored by default (see writeSnapshot)
+SNAPSHOT_PATH = 'data/preprocessed_data.mmap'
+
+# columns that can be used to filter the cache when it is read (see read())
+QUERY_COLUMNS = ['node_id', 'timestamp']
+
+# the version of the layout of the preprocessed data (PROCESSED_COLUMNS, COMPACT_DTYPES and the order rows are stored in)
+# caches written with a different version are rebuilt, so bump it whenever the layout changes
+SCHEMA_VERSION = 1
+
+# converts the preprocessed data to its compact representation (see COMPACT_DTYPES)
+def compactFrame(df : pd.DataFrame) -> pd.DataFrame:
+    return df.astype(COMPACT_DTYPES)
+
+# concatenates preprocessed dataframes, merging the categories of the categorical columns
+# (pd.concat would turn categorical columns with different categories back into python strings)
+def concatFrames(frames : List[pd.DataFrame]) -> pd.DataFrame:
+    if len(frames) == 0:
+        return compactFrame(pd.DataFrame(columns=PROCESSED_COLUMNS).astype({'timestamp' : 'datetime64[ns]'}))
+
+    columns = dict()
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            columns[column] = pd.Series(union_categoricals(parts, sort_categories=True))
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+
+    return pd.DataFrame(columns)
+
+# returns the days (as midnight timestamps) that the measurements in df were taken on
+def getDays(df : pd.DataFrame) -> pd.Series:
+    return df['timestamp'].dt.normalize()
+
+# returns a string that changes whenever the cache at cache_path is rewritten
+def cacheVersion(cache_path : str) -> str:
+    return str(os.stat(cache_path).st_mtime_ns)
+
+# the preprocessed data stored in a single HDF5 file
+# every batch that is written is stored as its own table, node_id and timestamp can be queried without reading everything
+# each table records the days it holds measurements for, so single days can be replaced or removed (see writeDay and dropDay)
+# (the space they free is only reclaimed by repack, which getData runs after updating the cache)
+class HDF5Cache:
+    def __init__(self, cache_path : str = CACHE_PATHS['hdf5']):
+        self.path = cache_path
+
+    def exists(self) -> bool:
+        return path.exists(self.path)
+
+    # returns the keys of the batches in the store
+    # (the categories of categorical columns are stored under each batch too, so only top level keys are batches)
+    @staticmethod
+    def partKeys(store : pd.HDFStore) -> List[str]:
+        return [key for key in sorted(store.keys()) if key.count('/') == 1 and key.startswith('/part_')]
+
+    # writes a batch to the store, along with the days it holds measurements for
+    @staticmethod
+    def putPart(store : pd.HDFStore, key : str, df : pd.DataFrame):
+        store.put(key, df, format='table', data_columns=QUERY_COLUMNS)
+        store.get_storer(key).attrs.days = [day.date().isoformat() for day in getDays(df).unique()]
+
+    # replaces the cache with the given batches of preprocessed data
+    # the batches are written to a temporary file first, so an interrupted write never leaves a partial cache behind
+    @profiled("Writing the HDF5 cache")
+    def write(self, frames : Iterable[pd.DataFrame]):
+        tmp_path = self.path + '.tmp'
+        with pd.HDFStore(tmp_path, mode='w') as store:
+            for i, df in enumerate(frames):
+                self.putPart(store, 'part_{:05d}'.format(i), df)
+
+        os.replace(tmp_path, self.path)
+
+    # removes the measurements taken on a day from the cache
+    def dropDay(self, day : date):
+        day = pd.Timestamp(day).normalize()
+        with pd.HDFStore(self.path, mode='a') as store:
+            for key in self.partKeys(store):
+                part_days = getattr(store.get_storer(key).attrs, 'days', None)
+                if part_days is not None and day.date().isoformat() not in part_days:
+                    continue
+
+                store.remove(key, where=["timestamp >= '{}'".format(day), "timestamp < '{}'".format(day + pd.Timedelta(days=1))])
+                if store.get_storer(key).nrows == 0:
+                    store.remove(key)
+                elif part_days is not None:
+                    store.get_storer(key).attrs.days = [part_day for part_day in part_days if part_day != day.date().isoformat()]
+
+    # replaces the measurements taken on a day with df, which is stored as a new batch
+    def writeDay(self, day : date, df : pd.DataFrame):
+        if self.exists():
+            self.dropDay(day)
+
+        with pd.HDFStore(self.path, mode='a') as store:
+            numbers = [int(key[len('/part_'):]) for key in self.partKeys(store) if key.startswith('/part_')]
+            self.putPart(store, 'part_{:05d}'.format(max(numbers) + 1 if numbers else 0), df)
+
+    # rewrites the cache without the space that dropDay and writeDay left behind (an HDF5 file never shrinks when tables are removed)
+    # the batches are copied to a temporary file one at a time, so this only needs as much memory as the largest of them
+    @profiled("Repacking the HDF5 cache")
+    def repack(self):
+        tmp_path = self.path + '.tmp'
+        with pd.HDFStore(self.path, mode='r') as store, pd.HDFStore(tmp_path, mode='w') as packed:
+            for i, key in enumerate(self.partKeys(store)):
+                self.putPart(packed, 'part_{:05d}'.format(i), store.select(key))
+
+        os.replace(tmp_path, self.path)
+
+    # returns the number of measurements in the cache, without reading them
+    def rows(self) -> int:
+        with pd.HDFStore(self.path, mode='r') as store:
+            return int(sum(store.get_storer(key).nrows for key in self.partKeys(store)))
+
+    # reads the cache, only returning the given columns of the measurements taken by node_ids between start and end (inclusive)
+    @profiled("Reading the HDF5 cache")
+    def read(self, columns : List[str] = None, node_ids : List[str] = None, start : date = None, end : date = None) -> pd.DataFrame:
+        conditions = list()
+        if node_ids is not None:
+            conditions.append("node_id in {}".format([str(node_id) for node_id in node_ids]))
+        if start is not None:
+            conditions.append("timestamp >= '{}'".format(pd.Timestamp(start).normalize()))
+        if end is not None:
+            conditions.append("timestamp < '{}'".format(pd.Timestamp(end).normalize() + pd.Timedelta(days=1)))
+
+        # caches in an older layout have no manifest, so getData rebuilds them before they are ever read
+        with pd.HDFStore(self.path, mode='r') as store:
+            frames = [store.select(key, where=conditions or None, columns=columns) for key in self.partKeys(store)]
+
+        return concatFrames(frames)
+
+# the preprocessed data stored as parquet files, partitioned by day: <path>/date=YYYY-MM-DD/part-NNNNN.parquet
+# only the days that are asked for are read, and node_id filters are pushed down to the parquet reader
+class ParquetCache:
+    def __init__(self, cache_path : str = CACHE_PATHS['parquet']):
+        self.path = cache_path
+
+    def exists(self) -> bool:
+        return path.isdir(self.path)
+
+    # returns the directory that the measurements for a day are stored in
+    def dayPath(self, day : date, root : str = None) -> str:
+        return path.join(root or self.path, 'date={}'.format(pd.Timestamp(day).date().isoformat()))
+
+    # returns the days that are stored in the cache, in order
+    def days(self) -> List[pd.Timestamp]:
+        if not self.exists():
+            return list()
+        days = [pd.Timestamp(name[len('date='):]) for name in os.listdir(self.path) if name.startswith('date=')]
+        return sorted(days)
+
+    # replaces the cache with the given batches of preprocessed data, each batch is split up by day
+    # the batches are written to a temporary directory first, so an interrupted write never leaves a partial cache behind
+    @profiled("Writing the parquet cache")
+    def write(self, frames : Iterable[pd.DataFrame]):
+        tmp_path = self.path + '.tmp'
+        if path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+
+        for i, df in enumerate(frames):
+            for day, day_df in df.groupby(getDays(df), sort=True):
+                day_path = self.dayPath(day, tmp_path)
+                os.makedirs(day_path, exist_ok=True)
+                day_df.to_parquet(path.join(day_path, 'part-{:05d}.parquet'.format(i)), index=False)
+
+        os.makedirs(tmp_path, exist_ok=True) # there may not have been any data to write
+        old_path = self.path + '.old'
+        if self.exists():
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        if path.exists(old_path):
+            shutil.rmtree(old_path)
+
+    # removes the measurements taken on a day from the cache
+    def dropDay(self, day : date):
+        day_path = self.dayPath(day)
+        if path.exists(day_path):
+            shutil.rmtree(day_path)
+
+    # replaces the measurements taken on a day with df
+    # the day is written to a temporary directory first (named so days() skips it), so an interrupted write never leaves a partial day behind
+    def writeDay(self, day : date, df : pd.DataFrame):
+        day_path = self.dayPath(day)
+        tmp_path = path.join(self.path, '.' + path.basename(day_path) + '.tmp')
+        if path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+
+        os.makedirs(tmp_path)
+        df.to_parquet(path.join(tmp_path, 'part-00000.parquet'), index=False)
+        self.dropDay(day)
+        os.replace(tmp_path, day_path)
+
+    # every day is a directory of its own that dropDay removes, so there is never any space to reclaim
+    def repack(self):
+        pass
+
+    # returns the number of measurements in the cache, from the metadata of the parquet files
+    def rows(self) -> int:
+        n_rows = 0
+        for day in self.days():
+            day_path = self.dayPath(day)
+            for name in os.listdir(day_path):
+                n_rows += pq.read_metadata(path.join(day_path, name)).num_rows
+        return n_rows
+
+    # reads the cache, only returning the given columns of the measurements taken by node_ids between start and end (inclusive)
+    @profiled("Reading the parquet cache")
+    def read(self, columns : List[str] = None, node_ids : List[str] = None, start : date = None, end : date = None) -> pd.DataFrame:
+        filters = None
+        if node_ids is not None:
+            filters = [('node_id', 'in', list(node_ids))]
+
+        frames = list()
+        for day in self.days():
+            if start is not None and day < pd.Timestamp(start).normalize():
+                continue
+            if end is not None and day > pd.Timestamp(end).normalize():
+                continue
+
+            day_path = self.dayPath(day)
+            for name in sorted(os.listdir(day_path)):
+                frames.append(pd.read_parquet(path.join(day_path, name), columns=columns, filters=filters))
+
+        return concatFrames(frames)
+
+# the available cache formats
+CACHE_FORMATS = {
+    'hdf5' : HDF5Cache,
+    'parquet' : ParquetCache
+}
+
+# returns the cache for the given format, stored at cache_path (or the format's default location)
+def openCache(cache_format : str = 'hdf5', cache_path : str = None):
+    if cache_format not in CACHE_FORMATS:
+        raise ValueError("Unknown cache format '{}', expected one of: {}".format(cache_format, ', '.join(CACHE_FORMATS)))
+
+    if cache_path is None:
+        cache_path = CACHE_PATHS[cache_format]
+    return CACHE_FORMATS[cache_format](cache_path)
+
+# returns a version of the data a cache holds that only depends on its content, computed from its manifest (see readManifest):
+# the schema version, the hash of the node metadata and the hash and number of measurements of every day
+# returns None if the manifest does not record the days
+def contentVersion(manifest : dict) -> str:
+    if manifest is None or manifest.get('days') is None:
+        return None
+    days = {day : [entry['hash'], entry['rows']] for day, entry in manifest['days'].items()}
+    content = json.dumps([manifest['schema_version'], manifest.get('nodes'), days], sort_keys=True)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+# returns where the manifest of the cache at cache_path is stored
+def manifestPath(cache_path : str) -> str:
+    return cache_path + '.manifest.json'
+
+# reads the manifest of the cache at cache_path, returns None if it has none
+# the manifest describes what the cache was built from: the schema version, the source files it was built from (and a hash of
+# the node metadata), the days it holds (with the byte range and hash of each day in the data file) and how many measurements it holds
+def readManifest(cache_path : str) -> dict:
+    try:
+        with open(manifestPath(cache_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# replaces the manifest of the cache at cache_path
+# it is written to a temporary file first, so an interrupted write never leaves a partial manifest behind
+def writeManifest(cache_path : str, manifest : dict):
+    tmp_path = manifestPath(cache_path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifestPath(cache_path))
+
+# removes the manifest of the cache at cache_path, so the cache is rebuilt if it is not written completely
+def removeManifest(cache_path : str):
+    if path.exists(manifestPath(cache_path)):
+        os.remove(manifestPath(cache_path))
+
+# writes the preprocessed data as a snapshot that can be memory mapped: one .npy file per column (the codes, for categorical columns),
+# plus a json file with the column names, categories and the version of the cache the snapshot was made from
+# every process that opens the snapshot shares the same pages of memory, instead of each one holding its own copy of the data
+@profiled("Writing the memory mapped snapshot")
+def writeSnapshot(df : pd.DataFrame, snapshot_path : str = SNAPSHOT_PATH, version : str = None):
+    tmp_path = '{}.tmp{}'.format(snapshot_path, os.getpid()) # other processes may be writing a snapshot at the same time
+    os.makedirs(tmp_path)
+
+    meta = {'columns' : list(df.columns), 'categories' : dict(), 'rows' : len(df), 'version' : version}
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            meta['categories'][column] = [str(category) for category in df[column].cat.categories]
+            np.save(path.join(tmp_path, column + '.codes.npy'), df[column].cat.codes.to_numpy())
+        else:
+            np.save(path.join(tmp_path, column + '.npy'), df[column].to_numpy())
+
+    with open(path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    old_path = '{}.old{}'.format(snapshot_path, os.getpid())
+    if path.exists(snapshot_path):
+        os.replace(snapshot_path, old_path)
+    try:
+        os.replace(tmp_path, snapshot_path)
+    except OSError: # another process finished its snapshot first, use theirs
+        shutil.rmtree(tmp_path)
+    if path.exists(old_path):
+        shutil.rmtree(old_path)
+
+# returns the version of the cache that the snapshot was made from, or None if there is no snapshot
+def snapshotVersion(snapshot_path : str = SNAPSHOT_PATH) -> str:
+    try:
+        with open(path.join(snapshot_path, 'meta.json')) as f:
+            return json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+# opens a snapshot written by writeSnapshot without copying it: every column is a read-only view of a memory mapped file
+@profiled("Opening the memory mapped snapshot")
+def openSnapshot(snapshot_path : str = SNAPSHOT_PATH) -> pd.DataFrame:
+    with open(path.join(snapshot_path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    columns = dict()
+    for column in meta['columns']:
+        if column in meta['categories']:
+            codes = np.load(path.join(snapshot_path, column + '.codes.npy'), mmap_mode='r')
+            columns[column] = pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(meta['categories'][column]))
+        else:
+            columns[column] = np.load(path.join(snapshot_path, column + '.npy'), mmap_mode='r')
+
+    # copy=False keeps each column in its own block, so pandas does not copy the columns into combined blocks
+    return pd.DataFrame(columns, copy=False)
\ No newline at end of file
@@ -0,0 +1,134 @@
+import pandas as pd
+import numpy as np
+from datetime import date
+from typing import List
+
+from data_parser import getData
+from data_filters import rootIndexed, PATH_COLUMNS
+from profiling import profiled
+
+AOT_CATALOG = None # cache the catalog in memory so it is only built once
+NODE_SUMMARY = None # cache the node summary in memory so it is only built once
+PRESENCE = None # cache the presence index in memory so it is only built once
+
+# builds a catalog of every sensor path in the data: node_id -> subsystem -> sensor -> parameter -> stats,
+# where stats holds the number of measurements ('rows') and when the first and last ones were taken ('first' and 'last')
+# this uses the offsets of the index (see data_filters.indexData), so it only looks at the first and last row of each path
+@profiled("Building the sensor catalog")
+def buildCatalog(df : pd.DataFrame) -> dict:
+    df, index = rootIndexed(df)
+
+    timestamps = df['timestamp'].to_numpy()
+
+    catalog = dict()
+    for group, (start, stop) in index.offsets.items():
+        if len(group) != len(PATH_COLUMNS):
+            continue
+
+        node_id, subsystem, sensor, parameter = group
+        sensors = catalog.setdefault(node_id, dict()).setdefault(subsystem, dict())
+        sensors.setdefault(sensor, dict())[parameter] = {
+            'rows' : stop - start,
+            'first' : pd.Timestamp(timestamps[start]),
+            'last' : pd.Timestamp(timestamps[stop - 1])
+        }
+
+    return catalog
+
+# returns the catalog of the data returned by getData
+def getCatalog() -> dict:
+    global AOT_CATALOG
+    if AOT_CATALOG is None:
+        AOT_CATALOG = buildCatalog(getData())
+    return AOT_CATALOG
+
+# returns the subsystems on a node (an empty list if the node has no data)
+def listSubsystems(node_id : str) -> List[str]:
+    return list(getCatalog().get(node_id, dict()))
+
+# returns the sensors in a node's subsystem
+def listSensors(node_id : str, subsystem : str) -> List[str]:
+    return list(getCatalog().get(node_id, dict()).get(subsystem, dict()))
+
+# returns the parameters measured by a node's sensor
+def listParameters(node_id : str, subsystem : str, sensor : str) -> List[str]:
+    return list(getCatalog().get(node_id, dict()).get(subsystem, dict()).get(sensor, dict()))
+
+# summarises every node in the data in a single pass: where it is ('latitude', 'longitude', 'address', 'description'),
+# the subsystems it reported ('subsystems') and when it was first and last seen ('first_seen', 'last_seen'), indexed by node_id
+@profiled("Summarising the nodes")
+def buildNodeSummary(df : pd.DataFrame, catalog : dict) -> pd.DataFrame:
+    df, index = rootIndexed(df)
+
+    # every row of a node has the same metadata, so the first row of each node is enough
+    first_rows = [index.offsets[(node_id,)][0] for node_id in catalog]
+    summary = df[['latitude', 'longitude', 'address', 'description']].iloc[first_rows].astype({'address' : object, 'description' : object})
+    summary.index = pd.Index(list(catalog), name='node_id')
+
+    summary['subsystems'] = [list(catalog[node_id]) for node_id in catalog]
+    summary['first_seen'] = [min(stats['first'] for stats in iterateStats(catalog[node_id])) for node_id in catalog]
+    summary['last_seen'] = [max(stats['last'] for stats in iterateStats(catalog[node_id])) for node_id in catalog]
+    return summary
+
+# records which days each node reported data from each of its subsystems, as a bitmap with a row per (node_id, subsystem)
+# and a column per day: 'groups' holds the (node_id, subsystem) of each row, 'days' the day of each column
+# and 'present' the bitmap itself, so finding what reported between two days is an OR across a few columns
+@profiled("Indexing which nodes reported on which days")
+def buildPresence(df : pd.DataFrame) -> dict:
+    df, index = rootIndexed(df)
+
+    groups = [group for group in index.offsets if len(group) == 2]
+    if len(df) == 0:
+        return {'groups' : groups, 'days' : pd.DatetimeIndex([]), 'present' : np.zeros((len(groups), 0), dtype=bool)}
+
+    # the day each measurement was taken on, counted from the first day in the data
+    ns_per_day = pd.Timedelta(days=1).value
+    day_numbers = df['timestamp'].to_numpy().view('int64') // ns_per_day
+    first_day = day_numbers.min()
+    day_numbers -= first_day
+    days = pd.to_datetime((first_day + np.arange(day_numbers.max() + 1)) * ns_per_day)
+
+    # the (node_id, subsystem) group of each measurement, since the groups are contiguous this is just a run of each group's number
+    sizes = [index.offsets[group][1] - index.offsets[group][0] for group in groups]
+    group_numbers = np.repeat(np.arange(len(groups)), sizes)
+
+    present = np.zeros((len(groups), len(days)), dtype=bool)
+    present[group_numbers, day_numbers] = True
+    return {'groups' : groups, 'days' : days, 'present' : present}
+
+# returns the presence bitmap of the data returned by getData
+def getPresence() -> dict:
+    global PRESENCE
+    if PRESENCE is None:
+        PRESENCE = buildPresence(getData())
+    return PRESENCE
+
+# returns the subsystems each node reported data from between start and end (inclusive), as node_id -> subsystems
+# nodes that did not report anything in that range are left out
+def listNodesReporting(start : date, end : date) -> dict:
+    presence = getPresence()
+    days = presence['days']
+    first = days.searchsorted(pd.Timestamp(start).normalize(), side='left')
+    last = days.searchsorted(pd.Timestamp(end).normalize(), side='right')
+
+    reported = presence['present'][:, first:last].any(axis=1)
+
+    reporting = dict()
+    for (node_id, subsystem), present in zip(presence['groups'], reported):
+        if present:
+            reporting.setdefault(node_id, list()).append(subsystem)
+    return reporting
+
+# yields the stats of every sensor path in a node's part of the catalog
+def iterateStats(node_catalog : dict):
+    for sensors in node_catalog.values():
+        for parameters in sensors.values():
+            for stats in parameters.values():
+                yield stats
+
+# returns the summary of every node in the data returned by getData, shared by every page
+def getNodeSummary() -> pd.DataFrame:
+    global NODE_SUMMARY
+    if NODE_SUMMARY is None:
+        NODE_SUMMARY = buildNodeSummary(getData(), getCatalog())
+    return NODE_SUMMARY
\ No newline at end of file
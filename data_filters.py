@@ -1,27 +1,234 @@
 import pandas as pd
+import numpy as np
+import weakref
+import threading
 from datetime import datetime
 
+from profiling import profiled
+
+ONE_DAY = pd.Timedelta(days=1)
+
+# the number of rows the filters below have looked at on each thread (see countScanned)
+SCANNED_ROWS = threading.local()
+
+# adds to the number of rows the filters have looked at on this thread: every row of the input for a filter that compares
+# every row, only the rows that were found for a lookup in the index
+def countScanned(n_rows : int):
+    SCANNED_ROWS.count = getattr(SCANNED_ROWS, 'count', 0) + n_rows
+
+# returns the number of rows the filters have looked at on this thread since the last call, and starts counting again
+def takeScanned() -> int:
+    count = getattr(SCANNED_ROWS, 'count', 0)
+    SCANNED_ROWS.count = 0
+    return count
+
+# an indexed dataframe is sorted by these columns, so every sensor path is a contiguous range of rows sorted by time
+SORT_COLUMNS = ['node_id', 'subsystem', 'sensor', 'parameter', 'timestamp']
+PATH_COLUMNS = SORT_COLUMNS[:-1]
+
+# the row ranges of every (node_id), (node_id, subsystem), ... (node_id, subsystem, sensor, parameter) group of a sorted dataframe
+# filtered frames share the offsets of the frame they came from: base is the row of that frame they start at,
+# prefix holds the path values every one of their rows has in common
+class GroupIndex:
+    def __init__(self, offsets : dict, base : int = 0, prefix : tuple = ()):
+        self.offsets = offsets
+        self.base = base
+        self.prefix = prefix
+
+# the index of every indexed dataframe that is still alive, by id
+# (indexes are kept here rather than on the dataframes so they are never copied along with them)
+INDEXES = dict()
+
+# associates an index with a dataframe until the dataframe is garbage collected
+def registerIndex(df : pd.DataFrame, index : GroupIndex):
+    key = id(df)
+
+    def unregister(ref):
+        if key in INDEXES and INDEXES[key][0] is ref:
+            del INDEXES[key]
+
+    INDEXES[key] = (weakref.ref(df, unregister), index)
+
+# returns the index of a dataframe, or None if it has not been indexed
+def lookupIndex(df : pd.DataFrame) -> GroupIndex:
+    entry = INDEXES.get(id(df))
+    if entry is None or entry[0]() is not df:
+        return None
+    return entry[1]
+
+# returns the sensor path columns of the dataframe as categoricals
+def pathCategoricals(df : pd.DataFrame) -> list:
+    columns = list()
+    for column in PATH_COLUMNS:
+        values = df[column]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+        columns.append(values)
+    return columns
+
+# returns the sort keys of the dataframe as integer arrays (category codes for the sensor path, nanoseconds for the timestamp)
+def sortKeys(df : pd.DataFrame) -> list:
+    keys = [values.cat.codes.to_numpy() for values in pathCategoricals(df)]
+    keys.append(df['timestamp'].to_numpy().view('int64'))
+    return keys
+
+# checks whether the dataframe is already sorted by SORT_COLUMNS, in a single pass
+def isSorted(df : pd.DataFrame) -> bool:
+    if len(df) < 2:
+        return True
+
+    in_order = np.zeros(len(df) - 1, dtype=bool)
+    equal_so_far = np.ones(len(df) - 1, dtype=bool)
+    for key in sortKeys(df):
+        in_order |= equal_so_far & (key[:-1] < key[1:])
+        equal_so_far &= key[:-1] == key[1:]
+    return bool((in_order | equal_so_far).all())
+
+# returns the row range of every group of sensor path prefixes in a sorted dataframe
+def buildOffsets(df : pd.DataFrame) -> dict:
+    offsets = dict()
+    n_rows = len(df)
+    if n_rows == 0:
+        return offsets
+
+    columns = pathCategoricals(df)
+    categories = [values.cat.categories for values in columns]
+    keys = [values.cat.codes.to_numpy() for values in columns]
+
+    group_starts = np.zeros(n_rows, dtype=bool)
+    group_starts[0] = True
+    for level in range(len(PATH_COLUMNS)):
+        # a new group starts wherever any column up to this level changes
+        group_starts[1:] |= keys[level][1:] != keys[level][:-1]
+        starts = np.flatnonzero(group_starts)
+        stops = np.append(starts[1:], n_rows)
+
+        for start, stop in zip(starts, stops):
+            group = tuple(categories[l][keys[l][start]] if keys[l][start] >= 0 else None for l in range(level + 1))
+            offsets[group] = (int(start), int(stop))
+
+    return offsets
+
+# sorts the dataframe by SORT_COLUMNS, if it is not sorted already
+@profiled("Sorting the data")
+def sortData(df : pd.DataFrame) -> pd.DataFrame:
+    if isSorted(df):
+        return df
+    return df.sort_values(SORT_COLUMNS, kind='mergesort', ignore_index=True)
+
+# sorts the dataframe by SORT_COLUMNS (if it is not sorted already) and indexes it, so that the filters below can find the rows
+# of a node, sensor path or day with a lookup instead of comparing every row
+# the filters return indexed frames too, so filters can be chained (e.g. filterByNodeId, then filterBySensorPath, then filterByDay)
+@profiled("Indexing the data")
+def indexData(df : pd.DataFrame) -> pd.DataFrame:
+    df = sortData(df)
+    registerIndex(df, GroupIndex(buildOffsets(df)))
+    return df
+
+# returns the dataframe and its index, indexing it first unless it was indexed itself rather than filtered from an indexed frame
+# (the offsets of a filtered frame are those of the frame it came from, so they can not be used as row numbers of its own)
+def rootIndexed(df : pd.DataFrame) -> tuple:
+    index = lookupIndex(df)
+    if index is None or index.base != 0 or len(index.prefix) != 0:
+        df = indexData(df)
+        index = lookupIndex(df)
+    return df, index
+
+# returns the rows of an indexed dataframe with the given sensor path prefix, indexed as well
+def sliceGroup(df : pd.DataFrame, index : GroupIndex, group : tuple) -> pd.DataFrame:
+    if group not in index.offsets:
+        return df.iloc[0:0]
+
+    start, stop = index.offsets[group]
+    group_df = df.iloc[start - index.base : stop - index.base]
+    registerIndex(group_df, GroupIndex(index.offsets, start, group))
+    return group_df
+
+# filters an indexed dataframe by sensor path, values holds the wanted node_id, subsystem, sensor and parameter (None for any)
+# returns None if the wanted values are not a prefix of the sensor path, since those rows are not contiguous
+def filterIndexedPath(df : pd.DataFrame, index : GroupIndex, values : list) -> pd.DataFrame:
+    group = list()
+    for level, value in enumerate(values):
+        if level < len(index.prefix):
+            if value is not None and value != index.prefix[level]:
+                return df.iloc[0:0]
+            group.append(index.prefix[level])
+        elif value is None:
+            break
+        else:
+            group.append(value)
+
+    if any(value is not None for value in values[len(group):]):
+        return None
+    elif tuple(group) == index.prefix:
+        return df
+    return sliceGroup(df, index, tuple(group))
+
+# filters an indexed dataframe with a single sensor path (which is sorted by time) to the measurements taken in [start, end)
+# returns None if the dataframe holds more than one sensor path
+def filterIndexedTime(df : pd.DataFrame, start : pd.Timestamp, end : pd.Timestamp) -> pd.DataFrame:
+    index = lookupIndex(df)
+    if index is None or len(index.prefix) < len(PATH_COLUMNS):
+        return None
+
+    timestamps = df['timestamp'].to_numpy()
+    first = int(timestamps.searchsorted(start.to_datetime64(), side='left'))
+    last = int(timestamps.searchsorted(end.to_datetime64(), side='left'))
+
+    time_df = df.iloc[first:last]
+    registerIndex(time_df, GroupIndex(index.offsets, index.base + first, index.prefix))
+    return time_df
+
+# returns the date of each measurement (as datetime.date objects)
+# only use this on filtered data, since it creates a python object for every row
+def getDates(df : pd.DataFrame) -> pd.Series:
+    return df['timestamp'].dt.date
+
+# returns the time of day of each measurement (as datetime.time objects)
+# only use this on filtered data, since it creates a python object for every row
+def getTimes(df : pd.DataFrame) -> pd.Series:
+    return df['timestamp'].dt.time
+
+# returns how long after midnight each measurement was taken
+def getTimeOfDay(df : pd.DataFrame) -> pd.Series:
+    return df['timestamp'] - df['timestamp'].dt.normalize()
+
 # filters the data frame so that it only includes data on a specific day
 def filterByDay(df : pd.DataFrame, day : datetime.date):
-    day_filter = df['date'] == day
+    day_start = pd.Timestamp(day)
+    days_data = filterIndexedTime(df, day_start, day_start + ONE_DAY)
+    if days_data is not None:
+        countScanned(len(days_data))
+        return days_data
+
+    countScanned(len(df))
+    day_filter = (df['timestamp'] >= day_start) & (df['timestamp'] < day_start + ONE_DAY)
     days_data = df[day_filter]
     return days_data
 
 # filters the data frame so that it only includes data in the range of start_time to end_time (inclusive)
 def filterByTime(df : pd.DataFrame, start_time : datetime.time, end_time : datetime.time):
-    filter_start_time = df['time'] >= start_time
-    filter_end_time = df['time'] <= end_time
+    countScanned(len(df))
+    time_of_day = getTimeOfDay(df)
+    filter_start_time = time_of_day >= pd.Timedelta(hours=start_time.hour, minutes=start_time.minute, seconds=start_time.second, microseconds=start_time.microsecond)
+    filter_end_time = time_of_day <= pd.Timedelta(hours=end_time.hour, minutes=end_time.minute, seconds=end_time.second, microseconds=end_time.microsecond)
     filter_time = filter_start_time & filter_end_time
     time_df = df[filter_time]
     return time_df
 
 # filters the data frame so that it only includes data in a specific range of dates (incl.)
 def filterByDateRange(df : pd.DataFrame, start : datetime, end : datetime):
-    start_day = start.date()
-    end_day = end.date()
-    
-    filter_start_date = df['date'] >= start_day
-    filter_end_date = df['date'] <= end_day
+    start_day = pd.Timestamp(start).normalize()
+    end_day = pd.Timestamp(end).normalize()
+
+    date_df = filterIndexedTime(df, start_day, end_day + ONE_DAY)
+    if date_df is not None:
+        countScanned(len(date_df))
+        return date_df
+
+    countScanned(len(df))
+    filter_start_date = df['timestamp'] >= start_day
+    filter_end_date = df['timestamp'] < end_day + ONE_DAY
 
     filter_date = filter_start_date & filter_end_date
 
@@ -29,6 +236,13 @@ def filterByDateRange(df : pd.DataFrame, start : datetime, end : datetime):
 
 # filter the data by node id
 def filterByNodeId(df : pd.DataFrame, node_id : str):
+    index = lookupIndex(df)
+    if index is not None:
+        node_df = filterIndexedPath(df, index, [node_id, None, None, None])
+        countScanned(len(node_df))
+        return node_df
+
+    countScanned(len(df))
     filter_node_id = df['node_id'] == node_id
     node_df = df[filter_node_id]
     return node_df
@@ -38,6 +252,14 @@ def filterBySensorPath(df : pd.DataFrame, subsystem : str = None, sensor : str =
     if subsystem == sensor == parameter == None:
         return df
 
+    index = lookupIndex(df)
+    if index is not None:
+        path_df = filterIndexedPath(df, index, [None, subsystem, sensor, parameter])
+        if path_df is not None:
+            countScanned(len(path_df))
+            return path_df
+
+    countScanned(len(df))
     filters = list()
     if subsystem != None:
         filters.append(df['subsystem'] == subsystem)
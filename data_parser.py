@@ -1,91 +1,407 @@
 import pandas as pd
 import os.path as path
-from datetime import datetime, timedelta
+import io
+import os
+import time
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
 from typing import List
 
+from data_filters import indexData, sortData
+from data_cache import PROCESSED_COLUMNS, SNAPSHOT_PATH, SCHEMA_VERSION, compactFrame, concatFrames, getDays, openCache, cacheVersion, contentVersion, readManifest, writeManifest, removeManifest, writeSnapshot, openSnapshot, snapshotVersion
+from profiling import peakMemory, profiled
+
 AOT_DATA = None # cache the data in memory so readEverything() is only slow once
 AOT_DATA_CACHED = False # bool (whether or not data is cached or not)
+AOT_DATA_VERSION = None # version of the data that was read (see dataVersion)
+AOT_DATA_LOCK = threading.Lock() # held while the data is loaded, so callers on other threads wait for it instead of loading it again
+
+# prints how long a stage took and the peak memory usage of the process so far
+def reportUsage(stage : str, start : float):
+    elapsed = time.perf_counter() - start
+    peak_rss = peakMemory()
+    if peak_rss is None:
+        print("{} took {:.2f}s".format(stage, elapsed))
+        return
+
+    print("{} took {:.2f}s (peak RSS: {:.1f} MiB)".format(stage, elapsed, peak_rss))
+
+# returns the number of bytes each column of the dataframe uses (including the python objects it references)
+def memoryReport(df : pd.DataFrame) -> pd.Series:
+    report = df.memory_usage(index=True, deep=True)
+    report['total'] = report.sum()
+    return report
+
+# read values as strings, then convert value_hrf to numbers (see parseValues)
+VALUE_DTYPES = {'value_raw' : str, 'value_hrf' : str}
+
+# converts the human readable values to numbers, values that are not numeric (e.g. ids) become NaN
+# this is done on the strings so the result does not depend on how the file was split up while parsing
+def parseValues(df : pd.DataFrame) -> pd.DataFrame:
+    df['value_hrf'] = pd.to_numeric(df['value_hrf'], errors='coerce')
+    return df
 
 # read in the data
+@profiled("Reading the measurements CSV")
 def readData(filepath : str) -> pd.DataFrame:
     print("Reading in measurements...")
-    df = pd.read_csv(filepath, parse_dates=["timestamp"])
+    df = pd.read_csv(filepath, parse_dates=["timestamp"], dtype=VALUE_DTYPES)
     print("Read in all measurements!")
+    return parseValues(df)
+
+# read in the byte offset and size of each day's measurements in the data file, indexed by day
+def readOffsets(filepath : str) -> pd.DataFrame:
+    df = pd.read_csv(filepath, parse_dates=['date'], index_col='date')
     return df
 
+# read in the column names from the header line of the data file
+def readHeader(filepath : str) -> List[str]:
+    with open(filepath, 'rb') as f:
+        header = f.readline()
+    return header.decode('utf-8').strip().split(',')
+
+# read in a single slice of the data file (without a header line)
+def readSlice(f, columns : List[str], offset : int, size : int) -> pd.DataFrame:
+    f.seek(offset)
+    chunk = f.read(size)
+    df = pd.read_csv(io.BytesIO(chunk), header=None, names=columns, parse_dates=["timestamp"], dtype=VALUE_DTYPES)
+    return parseValues(df)
+
+# read in only the measurements taken on the given days by seeking to their byte ranges in the data file
+# days that are not listed in the offsets file are skipped
+def readDays(filepath : str, days : List[date], offsets_path : str = 'data/offsets.csv') -> pd.DataFrame:
+    offsets = readOffsets(offsets_path)
+    columns = readHeader(filepath)
+
+    frames = list()
+    with open(filepath, 'rb') as f:
+        for day in sorted(set(pd.Timestamp(d).normalize() for d in days)):
+            if day not in offsets.index:
+                continue
+            print("Reading in measurements for {}...".format(day.date()))
+            frames.append(readSlice(f, columns, int(offsets.at[day, 'offset']), int(offsets.at[day, 'size'])))
+
+    if len(frames) == 0:
+        return pd.DataFrame(columns=columns).astype({'timestamp' : 'datetime64[ns]', 'value_hrf' : 'float64'})
+    return pd.concat(frames, ignore_index=True)
+
+# read in the measurements taken on a single day
+def readDay(filepath : str, day : date, offsets_path : str = 'data/offsets.csv') -> pd.DataFrame:
+    return readDays(filepath, [day], offsets_path)
+
 # read in the list of nodes
+@profiled("Reading the node metadata CSV")
 def readNodes(filepath : str) -> pd.DataFrame:
     print("Reading in node metadata...")
     df = pd.read_csv(filepath, parse_dates=["start_timestamp", "end_timestamp"], index_col='node_id')
     return df
 
-# reads in the data, reads in the nodes, returns a combined dataframe associates each measurement with a latitude, longitude, street address and description
-def getData(processed_data_path : str = 'data/preprocessed_data.hdf5', data_path : str = 'data/data.csv', node_path : str = 'data/nodes.csv'):
+# associates each measurement with the metadata of the node that took it
+# this is done column by column (a join on node_id) instead of row by row
+@profiled("Joining measurements with node metadata")
+def joinNodeMetadata(data : pd.DataFrame, nodes : pd.DataFrame) -> pd.DataFrame:
+    node_metadata = nodes[['description', 'address', 'lat', 'lon']].rename(columns={'lat' : 'latitude', 'lon' : 'longitude'})
+    node_metadata = node_metadata.astype({'description' : 'category', 'address' : 'category'}) # joined as codes, not strings
 
-    global AOT_DATA, AOT_DATA_CACHED
-    if AOT_DATA_CACHED:
-        return AOT_DATA.copy()
-    elif path.exists(processed_data_path):
-        print("Reading cached preprocessed data...")
-        df = pd.read_hdf(processed_data_path, key='df')
-        AOT_DATA = df
-        AOT_DATA_CACHED = True
-        return AOT_DATA
+    df = data[['timestamp', 'node_id', 'subsystem', 'sensor', 'parameter', 'value_hrf']].join(node_metadata, on='node_id')
+    return compactFrame(df[PROCESSED_COLUMNS])
+
+# reads in the compressed data file in batches of chunksize rows, without decompressing it to disk
+# each batch is joined with the node metadata as it is read, so when the batches are written to the cache
+# one at a time only one batch is ever held in memory no matter how big the file is
+def streamCompressedData(gz_path : str, node_path : str, chunksize : int = 1000000):
+    nodes = readNodes(node_path)
+
+    print("Streaming measurements from {}...".format(gz_path))
+    reader = pd.read_csv(gz_path, compression='gzip', chunksize=chunksize, parse_dates=["timestamp"], dtype=VALUE_DTYPES)
+    for i, chunk in enumerate(reader):
+        df = joinNodeMetadata(parseValues(chunk), nodes)
+        print("Preprocessed batch {} ({} measurements)".format(i, len(df)))
+        yield df
+
+# reads in and preprocesses the measurements from a single day
+# this is run in a worker process when ingesting in parallel, so it has to be a top level function
+def processDay(day : date, data_path : str, node_path : str, offsets_path : str) -> pd.DataFrame:
+    data = readDay(data_path, day, offsets_path)
+    nodes = readNodes(node_path)
+    return joinNodeMetadata(data, nodes)
+
+# preprocesses each of the given days, spread across a pool of worker processes if workers > 1
+# returns one dataframe per day, in the same order as days
+# the workers are spawned rather than forked, since getData can be running on a thread while the app serves requests on others (see run.py --background)
+def processDays(days : List[date], data_path : str, node_path : str, offsets_path : str, workers : int = 1) -> List[pd.DataFrame]:
+    n_days = len(days)
+    if workers <= 1:
+        return [processDay(day, data_path, node_path, offsets_path) for day in days]
+
+    print("Preprocessing {} days with {} worker processes...".format(n_days, workers))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(processDay, days, [data_path] * n_days, [node_path] * n_days, [offsets_path] * n_days))
+
+# preprocesses every day listed in the offsets file, spread across a pool of worker processes
+# the days are concatenated in order, so the result matches reading the whole file at once
+def processDaysInParallel(data_path : str, node_path : str, offsets_path : str, workers : int) -> pd.DataFrame:
+    days = readOffsets(offsets_path).index
+    return concatFrames(processDays(days, data_path, node_path, offsets_path, workers))
+
+# returns the size and modification time of each of the given files (None for files that do not exist)
+def sourceStats(filepaths : List[str]) -> dict:
+    stats = dict()
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+            stats[filepath] = {'size' : stat.st_size, 'mtime_ns' : stat.st_mtime_ns}
+        except OSError:
+            stats[filepath] = None
+    return stats
+
+# returns a hash of the bytes of a file, or None if it does not exist
+def hashFile(filepath : str) -> str:
+    if not path.exists(filepath):
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# returns the byte range and a hash of the bytes of each day listed in the offsets file (or only the given ones), by day ('YYYY-MM-DD')
+# a day whose hash has not changed does not need to be preprocessed again, even if the days before it moved it around in the file
+def hashDays(filepath : str, offsets_path : str, only_days : List[str] = None) -> dict:
+    offsets = readOffsets(offsets_path)
+
+    days = dict()
+    with open(filepath, 'rb') as f:
+        for day, (offset, size) in offsets[['offset', 'size']].iterrows():
+            if only_days is not None and day.date().isoformat() not in only_days:
+                continue
+            f.seek(int(offset))
+            digest = hashlib.blake2b(digest_size=16)
+            remaining = int(size)
+            while remaining > 0:
+                block = f.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+            days[day.date().isoformat()] = {'offset' : int(offset), 'size' : int(size), 'hash' : digest.hexdigest()}
+    return days
+
+# describes the preprocessed data df that was just built from the source files (see data_cache.readManifest)
+# the days are only recorded if the data file has an offsets file, since otherwise they can not be preprocessed on their own
+def buildManifest(df : pd.DataFrame, data_path : str, node_path : str, offsets_path : str) -> dict:
+    days = None
+    if path.exists(data_path) and path.exists(offsets_path):
+        rows = getDays(df).value_counts()
+        days = hashDays(data_path, offsets_path)
+        for day, entry in days.items():
+            entry['rows'] = int(rows.get(pd.Timestamp(day), 0))
+
+    return {
+        'schema_version' : SCHEMA_VERSION,
+        'sources' : sourceStats([data_path, data_path + '.gz', node_path, offsets_path]),
+        'nodes' : hashFile(node_path),
+        'days' : days,
+        'rows' : len(df)
+    }
+
+# checks the cache against its manifest and brings it up to date with the source files, without rebuilding all of it:
+# only the days that are new or whose bytes in the data file changed are preprocessed again, days that are gone are removed
+# returns False if the cache can not be trusted or updated a day at a time and has to be rebuilt
+# (it has no manifest or an old schema, it holds a different number of measurements than it should, or the node metadata changed)
+@profiled("Checking the cache against its manifest")
+def refreshProcessedData(cache, data_path : str, node_path : str, offsets_path : str, workers : int = 1) -> bool:
+    manifest = readManifest(cache.path)
+    if manifest is None or manifest.get('schema_version') != SCHEMA_VERSION:
+        print("Cached preprocessed data has no manifest or uses an old layout, rebuilding it...")
+        return False
+
+    n_rows = cache.rows()
+    if n_rows != manifest['rows']:
+        print("Cached preprocessed data holds {} measurements instead of {}, rebuilding it...".format(n_rows, manifest['rows']))
+        return False
+
+    sources = sourceStats([data_path, data_path + '.gz', node_path, offsets_path])
+    if sources[node_path] != manifest['sources'].get(node_path):
+        print("Node metadata changed, rebuilding cached preprocessed data...")
+        return False
+
+    if sources != manifest['sources'] and (manifest['days'] is None or not path.exists(data_path) or not path.exists(offsets_path)):
+        print("Measurements changed, rebuilding cached preprocessed data...")
+        return False
+    elif manifest['days'] is None:
+        return True
+
+    if sources == manifest['sources']:
+        # the data file did not change, so only days that were invalidated (see invalidateDay) need to be preprocessed
+        stale_days = [day.date().isoformat() for day in readOffsets(offsets_path).index if day.date().isoformat() not in manifest['days']]
+        if len(stale_days) == 0:
+            return True
+        days = dict(manifest['days'])
+        days.update(hashDays(data_path, offsets_path, stale_days))
+    else:
+        days = hashDays(data_path, offsets_path)
+        stale_days = [day for day, entry in days.items() if day not in manifest['days'] or entry['hash'] != manifest['days'][day]['hash']]
+        for day, entry in days.items():
+            if day not in stale_days:
+                entry['rows'] = manifest['days'][day]['rows']
+
+    start = time.perf_counter()
+    for day in manifest['days']:
+        if day not in days:
+            print("Removing {} from cached preprocessed data...".format(day))
+            cache.dropDay(day)
+            n_rows -= manifest['days'][day]['rows']
+
+    print("Preprocessing {} new or changed days...".format(len(stale_days)))
+    for day, df in zip(stale_days, processDays([pd.Timestamp(day) for day in stale_days], data_path, node_path, offsets_path, workers)):
+        if day in manifest['days']:
+            n_rows -= manifest['days'][day]['rows']
+        if len(df) > 0:
+            cache.writeDay(day, sortData(df))
+        elif day in manifest['days']: # nothing was measured that day anymore
+            cache.dropDay(day)
+        days[day]['rows'] = len(df)
+        n_rows += len(df)
+    if len(stale_days) > 0 or any(day not in days for day in manifest['days']):
+        cache.repack()
+    reportUsage("Updating cached preprocessed data", start)
+
+    writeManifest(cache.path, {'schema_version' : SCHEMA_VERSION, 'sources' : sources, 'nodes' : manifest.get('nodes'), 'days' : days, 'rows' : n_rows})
+    return True
+
+# removes a day from the cached preprocessed data, the next time getData is called it is preprocessed again
+def invalidateDay(day : date, processed_data_path : str = None, cache_format : str = 'hdf5'):
+    cache = openCache(cache_format, processed_data_path)
+    manifest = readManifest(cache.path)
+    day = pd.Timestamp(day).date().isoformat()
+    if not cache.exists() or manifest is None or manifest['days'] is None or day not in manifest['days']:
+        return
+
+    print("Invalidating cached preprocessed data for {}...".format(day))
+    cache.dropDay(day)
+    cache.repack()
+    manifest['rows'] -= manifest['days'].pop(day)['rows']
+    writeManifest(cache.path, manifest)
+
+# preprocesses the data and writes the result to the cache, see getData for the different modes
+# the manifest is written last, so a cache whose write was interrupted has none and is rebuilt
+def buildProcessedData(cache, data_path : str, node_path : str, offsets_path : str, workers : int) -> pd.DataFrame:
+    start = time.perf_counter()
+    removeManifest(cache.path)
+    if not path.exists(data_path) and path.exists(data_path + '.gz'):
+        cache.write(streamCompressedData(data_path + '.gz', node_path))
+        reportUsage("Streaming compressed measurements", start)
+
+        df = cache.read()
+        writeManifest(cache.path, buildManifest(df, data_path, node_path, offsets_path))
+        reportUsage("Cold start", start)
+        return df
+    elif workers > 1 and path.exists(offsets_path):
+        df = processDaysInParallel(data_path, node_path, offsets_path, workers)
+        reportUsage("Preprocessing", start)
     else:
         data = readData(data_path)
         nodes = readNodes(node_path)
+        reportUsage("Reading measurements and node metadata", start)
+
+        print("Joining measurements with node metadata...")
+        df = joinNodeMetadata(data, nodes)
+        del data # the raw measurements are no longer needed, free them before writing the cache
+        reportUsage("Preprocessing", start)
+
+    print("Sorting preprocessed data...")
+    df = sortData(df) # stored sorted, so it does not need to be sorted again when the cache is read (see indexData)
+    reportUsage("Sorting", start)
+
+    print("Writing new dataframe to cache location...")
+    cache.write([df])
+    writeManifest(cache.path, buildManifest(df, data_path, node_path, offsets_path))
+    reportUsage("Cold start", start)
+    return df
+
+# reads in the data, reads in the nodes, returns a combined dataframe associates each measurement with a latitude, longitude, street address and description
+# if workers > 1, the days listed in offsets_path are preprocessed in parallel by that many processes
+# if data_path does not exist but a gzipped copy (data_path + '.gz') does, the gzipped copy is streamed in batches
+# cache_format picks how the preprocessed data is cached ('hdf5' or 'parquet', see data_cache), processed_data_path defaults to the format's usual location
+# if shared is True, the data is opened from a memory mapped snapshot (written from the cache if needed), so every process
+# that opens it shares a single copy of the data instead of keeping its own
+# an existing cache is checked against its manifest first: days that are new or changed in the data file are preprocessed
+# and replaced on their own, and the whole cache is only rebuilt if that is not possible (see refreshProcessedData)
+# the same dataframe is returned to every caller, so it is read-only: modifying it in place would change it for every request
+# (and with shared=True it is memory mapped read-only, so writing to its values raises), copy it or the rows you need first
+def getData(processed_data_path : str = None, data_path : str = 'data/data.csv', node_path : str = 'data/nodes.csv', offsets_path : str = 'data/offsets.csv', workers : int = 1, cache_format : str = 'hdf5', shared : bool = False, snapshot_path : str = SNAPSHOT_PATH):
+
+    if AOT_DATA_CACHED:
+        return AOT_DATA
+
+    with AOT_DATA_LOCK:
+        return loadProcessedData(processed_data_path, data_path, node_path, offsets_path, workers, cache_format, shared, snapshot_path)
+
+# does the work of getData, only call it while holding AOT_DATA_LOCK
+def loadProcessedData(processed_data_path : str, data_path : str, node_path : str, offsets_path : str, workers : int, cache_format : str, shared : bool, snapshot_path : str) -> pd.DataFrame:
+    global AOT_DATA, AOT_DATA_CACHED, AOT_DATA_VERSION
+    if AOT_DATA_CACHED: # another thread loaded it while this one was waiting
+        return AOT_DATA
 
-        # make empty dataframe
-        df = dict()
-
-        df['date'] = []
-        df['time'] = []
-        df['description'] = []
-        df['node_id'] = []
-        df['latitude'] = []
-        df['longitude'] = []
-        df['address'] = []
-        df['subsystem'] = []
-        df['sensor'] = []
-        df['parameter'] = []
-        df['value_hrf'] = []
-
-        print("Converting measurements to a dictionary...")
-        measurements = data.to_dict('index')
-
-        print("Converting node data to a dictionary...")
-        nodes_dict = nodes.to_dict('index')
-
-        print("Collecting new dataframe...")
-        for m in measurements:
-            measurement = measurements[m]
-            node_id = measurement['node_id']
-            # store the node id
-            df['node_id'].append(node_id)
-
-            # store the timestamp
-            dt = measurement['timestamp']
-            time = dt.time()
-            date = dt.date()
-            df['date'].append(date)
-            df['time'].append(time)
-            
-            # attach node metadata
-            df['description'].append(nodes_dict[node_id]['description'])
-            df['address'].append(nodes_dict[node_id]['address'])
-            df['latitude'].append(nodes_dict[node_id]['lat'])
-            df['longitude'].append(nodes_dict[node_id]['lon'])
-
-            # attach measurement data
-            df['subsystem'].append(measurement['subsystem'])
-            df['sensor'].append(measurement['sensor'])
-            df['parameter'].append(measurement['parameter'])
-            df['value_hrf'].append(measurement['value_hrf'])
-        
-        print("Generating new dataframe...")
-        df = pd.DataFrame.from_dict(df)
-        print("Writing new dataframe to cache location...")
-        df.to_hdf(processed_data_path, key='df')
-        AOT_DATA = df
+    cache = openCache(cache_format, processed_data_path)
+
+    # changes the cache version if any days are replaced, so an outdated snapshot is not used
+    cache_valid = cache.exists() and refreshProcessedData(cache, data_path, node_path, offsets_path, workers)
+
+    if shared and cache_valid and snapshotVersion(snapshot_path) == cacheVersion(cache.path):
+        start = time.perf_counter()
+        print("Opening memory mapped snapshot of preprocessed data...")
+        AOT_DATA = indexData(openSnapshot(snapshot_path)) # the snapshot is stored sorted, so this does not copy it
+        reportUsage("Opening memory mapped snapshot", start)
+        AOT_DATA_VERSION = dataVersion(cache)
         AOT_DATA_CACHED = True
-        return AOT_DATA
\ No newline at end of file
+        return AOT_DATA
+
+    df = None
+    if cache_valid:
+        start = time.perf_counter()
+        print("Reading cached preprocessed data...")
+        df = cache.read()
+        reportUsage("Reading cached preprocessed data", start)
+
+    if df is None:
+        df = buildProcessedData(cache, data_path, node_path, offsets_path, workers)
+
+    start = time.perf_counter()
+    df = indexData(df) # sort the data by sensor path, so the filters in data_filters can look up rows instead of scanning them
+    reportUsage("Indexing preprocessed data", start)
+
+    if shared:
+        start = time.perf_counter()
+        print("Writing memory mapped snapshot of preprocessed data...")
+        writeSnapshot(df, snapshot_path, cacheVersion(cache.path))
+        df = indexData(openSnapshot(snapshot_path)) # replace the private copy with the shared one
+        reportUsage("Writing memory mapped snapshot", start)
+
+    AOT_DATA = df
+    AOT_DATA_VERSION = dataVersion(cache)
+    AOT_DATA_CACHED = True
+    return AOT_DATA
+
+# returns the version of the data in a cache: its content version (see data_cache.contentVersion), so every machine that built
+# its cache from the same files agrees on it, or the time the cache was written if its manifest does not record its days
+def dataVersion(cache) -> str:
+    return contentVersion(readManifest(cache.path)) or cacheVersion(cache.path)
+
+# returns the version of the data returned by getData, anything derived from the data can be stored along with it
+# and reused for as long as the version stays the same
+def getDataVersion() -> str:
+    getData()
+    return AOT_DATA_VERSION
+
+# reads only part of the cached preprocessed data: the given columns of the measurements taken by node_ids between start and end (inclusive)
+# the filters are applied while the cache is read, so the rest of the data is never loaded into memory
+def loadData(columns : List[str] = None, node_ids : List[str] = None, start : date = None, end : date = None, processed_data_path : str = None, cache_format : str = 'hdf5') -> pd.DataFrame:
+    cache = openCache(cache_format, processed_data_path)
+    if not cache.exists():
+        getData(processed_data_path, cache_format=cache_format) # build the cache first
+    return cache.read(columns=columns, node_ids=node_ids, start=start, end=end)
\ No newline at end of file
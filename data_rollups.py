@@ -0,0 +1,134 @@
+import pandas as pd
+import numpy as np
+import os
+import os.path as path
+import time
+import threading
+from typing import Dict
+
+from data_parser import getData, getDataVersion, reportUsage
+from data_filters import indexData, rootIndexed, PATH_COLUMNS
+from profiling import profiled
+
+AOT_ROLLUPS = None # cache the rollups in memory so they are only read once
+AOT_ROLLUPS_LOCK = threading.Lock() # held while the rollups are read or built, so they are only built once
+
+# where the rollups are stored by default
+ROLLUP_PATH = 'data/preprocessed_rollups.hdf5'
+
+# the width of the time buckets of each rollup, coarsest first
+ROLLUP_RESOLUTIONS = {
+    '1h' : pd.Timedelta(hours=1),
+    '5min' : pd.Timedelta(minutes=5),
+    '1min' : pd.Timedelta(minutes=1)
+}
+
+# columns of a rollup: every (sensor path, time bucket) with measurements has a row holding the number of measurements,
+# their mean, min and max and the sum of their squares (so the variance can be recovered), timestamp is the start of the bucket
+ROLLUP_COLUMNS = ['timestamp', 'node_id', 'subsystem', 'sensor', 'parameter', 'count', 'mean', 'min', 'max', 'sumsq']
+
+# aggregates the measurements of an indexed dataframe into time buckets of the given width, per sensor path
+# the data is sorted by sensor path and time, so every bucket is a contiguous run of rows and can be reduced without a groupby
+def buildRollup(df : pd.DataFrame, resolution : pd.Timedelta) -> pd.DataFrame:
+    df, index = rootIndexed(df)
+
+    # number every sensor path, so a bucket ends wherever the path or the bucket changes
+    path_ids = np.zeros(len(df), dtype=np.int64)
+    for path_id, (group, (start, stop)) in enumerate(item for item in index.offsets.items() if len(item[0]) == len(PATH_COLUMNS)):
+        path_ids[start:stop] = path_id
+
+    values = df['value_hrf'].to_numpy(dtype=np.float64)
+    rows = np.flatnonzero(~np.isnan(values)) # missing values are not measurements
+    values = values[rows]
+    path_ids = path_ids[rows]
+    buckets = df['timestamp'].to_numpy().view('int64')[rows] // resolution.value
+
+    bucket_starts = np.flatnonzero(np.append(len(values) > 0, (path_ids[1:] != path_ids[:-1]) | (buckets[1:] != buckets[:-1]))) # no buckets without measurements
+    counts = np.diff(np.append(bucket_starts, len(values)))
+
+    rollup = dict()
+    rollup['timestamp'] = pd.Series((buckets[bucket_starts] * resolution.value).view('datetime64[ns]'))
+    for column in PATH_COLUMNS:
+        rollup[column] = df[column].iloc[rows[bucket_starts]].reset_index(drop=True)
+    if len(values) > 0:
+        sums = np.add.reduceat(values, bucket_starts)
+        rollup['count'] = counts.astype(np.int32)
+        rollup['mean'] = (sums / counts).astype(np.float32)
+        rollup['min'] = np.minimum.reduceat(values, bucket_starts).astype(np.float32)
+        rollup['max'] = np.maximum.reduceat(values, bucket_starts).astype(np.float32)
+        rollup['sumsq'] = np.add.reduceat(values * values, bucket_starts)
+    else:
+        rollup['count'] = np.zeros(0, dtype=np.int32)
+        for column in ['mean', 'min', 'max']:
+            rollup[column] = np.zeros(0, dtype=np.float32)
+        rollup['sumsq'] = np.zeros(0, dtype=np.float64)
+
+    return pd.DataFrame(rollup, columns=ROLLUP_COLUMNS)
+
+# builds every rollup in ROLLUP_RESOLUTIONS
+@profiled("Building rollups")
+def buildRollups(df : pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    return {name : buildRollup(df, resolution) for name, resolution in ROLLUP_RESOLUTIONS.items()}
+
+# stores the rollups along with the version of the data they were built from
+# they are written to a temporary file first, so an interrupted write never leaves partial rollups behind
+def writeRollups(rollups : Dict[str, pd.DataFrame], rollup_path : str = ROLLUP_PATH, version : str = None):
+    tmp_path = rollup_path + '.tmp'
+    with pd.HDFStore(tmp_path, mode='w') as store:
+        for name, rollup in rollups.items():
+            store.put('rollup_' + name, rollup, format='table')
+            store.get_storer('rollup_' + name).attrs.data_version = version
+    os.replace(tmp_path, rollup_path)
+
+# reads the rollups stored at rollup_path, returns None if they are missing or were built from a different version of the data
+@profiled("Reading rollups")
+def readRollups(rollup_path : str = ROLLUP_PATH, version : str = None) -> Dict[str, pd.DataFrame]:
+    if not path.exists(rollup_path):
+        return None
+
+    rollups = dict()
+    with pd.HDFStore(rollup_path, mode='r') as store:
+        for name in ROLLUP_RESOLUTIONS:
+            key = '/rollup_' + name
+            if key not in store.keys() or getattr(store.get_storer(key).attrs, 'data_version', None) != version:
+                return None
+            rollups[name] = store.select(key)
+    return rollups
+
+# returns the rollups of the data returned by getData, indexed like the data itself (see data_filters.indexData)
+# so the same filters can be used on them
+# the rollups are built once and stored in rollup_path, they are only rebuilt when the data changes
+def getRollups(rollup_path : str = ROLLUP_PATH) -> Dict[str, pd.DataFrame]:
+    global AOT_ROLLUPS
+    if AOT_ROLLUPS is not None:
+        return AOT_ROLLUPS
+
+    with AOT_ROLLUPS_LOCK:
+        if AOT_ROLLUPS is not None:
+            return AOT_ROLLUPS
+
+        version = getDataVersion()
+        rollups = readRollups(rollup_path, version)
+        if rollups is None:
+            start = time.perf_counter()
+            print("Building rollups of preprocessed data...")
+            rollups = buildRollups(getData())
+            writeRollups(rollups, rollup_path, version)
+            reportUsage("Building rollups", start)
+
+        AOT_ROLLUPS = {name : indexData(rollup) for name, rollup in rollups.items()}
+    return AOT_ROLLUPS
+
+# returns the name and rollup with the widest buckets that still has at least points buckets in a time span of the given length
+# returns None if none of them do, then the raw measurements should be used instead
+def pickRollup(span : pd.Timedelta, points : int):
+    for name, resolution in ROLLUP_RESOLUTIONS.items():
+        if span / resolution >= points:
+            return name, getRollups()[name]
+    return None
+
+# the moving average over window buckets of a rollup, weighted by the number of measurements in each bucket
+def rollupMovingAverage(rollup : pd.DataFrame, window : int = 10) -> pd.Series:
+    counts = rollup['count'].astype(np.float64)
+    sums = rollup['mean'].astype(np.float64) * counts
+    return sums.rolling(window).sum() / counts.rolling(window).sum()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import numpy as np
+
+# reduces a series of points to at most n_out points before it is plotted, returning the indices of the points to keep
+# points whose y value is NaN are never kept, since they are not drawn anyway
+#   'lttb' - largest triangle three buckets, keeps the overall shape of the series
+#   'minmax' - the smallest and largest point of each bucket, keeps every peak
+#   None - keeps every point
+def downsample(x : np.ndarray, y : np.ndarray, n_out : int, method : str = 'lttb') -> np.ndarray:
+    valid = np.flatnonzero(~np.isnan(y))
+    if method is None or len(valid) <= n_out:
+        return valid
+
+    x = np.asarray(x, dtype='float64')[valid]
+    y = np.asarray(y, dtype='float64')[valid]
+    if method == 'lttb':
+        return valid[lttb(x, y, n_out)]
+    elif method == 'minmax':
+        return valid[minMax(y, n_out)]
+    else:
+        raise ValueError("Unknown downsampling method '{}', expected 'lttb', 'minmax' or None".format(method))
+
+# largest triangle three buckets: always keeps the first and last point, splits the rest into n_out - 2 buckets and keeps
+# the point of each bucket that forms the largest triangle with the point kept from the previous bucket and the average of the next one
+def lttb(x : np.ndarray, y : np.ndarray, n_out : int) -> np.ndarray:
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64') # the buckets cover every point but the first and the last
+    kept = np.empty(n_out, dtype='int64')
+    kept[0] = 0
+    kept[-1] = n - 1
+
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_stop = edges[bucket + 1], edges[bucket + 2]
+        else:
+            next_start, next_stop = n - 1, n # the last point is the next bucket of the last bucket
+        next_x = x[next_start:next_stop].mean()
+        next_y = y[next_start:next_stop].mean()
+
+        # twice the area of the triangle formed by the previous point, each point in the bucket and the average of the next bucket
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous]) - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        kept[bucket + 1] = previous
+
+    return kept
+
+# splits the points into n_out // 2 buckets and keeps the smallest and largest point of each one (in order)
+def minMax(y : np.ndarray, n_out : int) -> np.ndarray:
+    n = len(y)
+    n_buckets = max(1, n_out // 2)
+    if n <= n_out:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_buckets + 1).astype('int64')
+    kept = list()
+    for start, stop in zip(edges[:-1], edges[1:]):
+        bucket = y[start:stop]
+        kept.extend(sorted({start + int(bucket.argmin()), start + int(bucket.argmax())}))
+
+    return np.array(kept, dtype='int64')
\ No newline at end of file
@@ -0,0 +1,195 @@
+# load tests the app over http, the way browsers use it, run with: python loadtest.py --url http://127.0.0.1:8050
+# or compare the flask development server with the production server (see run.py --production) with: python loadtest.py --compare
+import argparse
+import json
+import os.path as path
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# the outputs of the callback that updates the dropdowns and the sensor graph of the home page, see DashApp.pages.Home
+SELECTION_OUTPUTS = [(component, prop) for component in ['subsystem', 'sensor', 'parameter'] for prop in ['options', 'value', 'disabled']] + [('graph_job', 'data')]
+
+# sends a request, returns the response body (raises for anything but a 2xx response)
+def request(url : str, body : dict = None, timeout : float = 60) -> bytes:
+    data = None if body is None else json.dumps(body).encode()
+    headers = {'Content-Type' : 'application/json'} if body is not None else dict()
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=timeout) as response:
+        return response.read()
+
+# calls a callback the way the browser does, returns its response (None if it did not update anything)
+def callback(url : str, outputs : list, inputs : list, state : list = (), changed : list = None) -> dict:
+    def prop(component, name, value=None):
+        return {'id' : component, 'property' : name, 'value' : value}
+
+    body = {
+        'output' : '..' + '...'.join('{}.{}'.format(component, name) for component, name in outputs) + '..' if len(outputs) > 1 else '{}.{}'.format(*outputs[0]),
+        'outputs' : [prop(*output) for output in outputs] if len(outputs) > 1 else prop(*outputs[0]),
+        'inputs' : [prop(*input) for input in inputs],
+        'state' : [prop(*item) for item in state],
+        'changedPropIds' : changed if changed is not None else ['{}.{}'.format(*inputs[0][:2])]
+    }
+    response = request(url + '/_dash-update-component', body)
+    return json.loads(response)['response'] if len(response) > 0 else None
+
+# returns the component with the given id in a layout
+def findComponent(layout, component_id : str) -> dict:
+    if isinstance(layout, dict):
+        if layout.get('props', dict()).get('id') == component_id:
+            return layout
+        children = list(layout.values())
+    elif isinstance(layout, list):
+        children = layout
+    else:
+        return None
+
+    for child in children:
+        component = findComponent(child, component_id)
+        if component is not None:
+            return component
+    return None
+
+# what a visitor does: opens the home page, then graphs each of a few nodes in turn
+# every request is timed and recorded in timings, as (kind of request, seconds, whether it failed)
+class Visitor:
+    def __init__(self, url : str, nodes : list, timings : list, vary_width : bool):
+        self.url = url
+        self.nodes = nodes
+        self.timings = timings
+        self.vary_width = vary_width
+        self.job = None
+
+    def timed(self, kind : str, function, *args):
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+            self.timings.append((kind, time.perf_counter() - start, False))
+            return result
+        except Exception:
+            self.timings.append((kind, time.perf_counter() - start, True))
+            return None
+
+    def openPage(self):
+        self.timed('index', request, self.url + '/')
+        self.timed('page', callback, self.url, [('content-div', 'children')], [('main_dropdown', 'value', 'Home'), ('warmup_interval', 'disabled', True)])
+
+    # selects a node, then polls the job building its graph until the graph is shown
+    def graphNode(self, node : str):
+        width = random.randrange(300, 1900) if self.vary_width else 1000 # every width is a different graph, so caches do not help
+        inputs = [('node_dropdown', 'value', node), ('subsystem', 'value'), ('sensor', 'value'), ('parameter', 'value'),
+                  ('process_data', 'value', []), ('days', 'value', [24, 30]), ('downsampling', 'value', 'lttb'),
+                  ('graph_width', 'data', width), ('sensor_graph', 'relayoutData')]
+        response = self.timed('select', callback, self.url, SELECTION_OUTPUTS, inputs, [('graph_job', 'data', self.job)], ['node_dropdown.value'])
+        if response is None:
+            return
+        self.job = response['graph_job']['data']
+
+        for n_intervals in range(200):
+            response = self.timed('graph', self.pollGraph, n_intervals)
+            if response is None or response['graph_poll']['disabled']:
+                return
+            time.sleep(0.05)
+
+    # checks on the job building the graph, raises (so the poll counts as failed) unless it is still running or the graph is shown
+    def pollGraph(self, n_intervals : int) -> dict:
+        response = callback(self.url, [('sensor_graph', 'figure'), ('graph_poll', 'disabled'), ('graph_progress', 'children')],
+                            [('graph_job', 'data', self.job), ('graph_poll', 'n_intervals', n_intervals)])
+        if response is None: # a browser would keep polling forever
+            raise RuntimeError("The graph poll did not update anything")
+        if response['graph_poll']['disabled'] and 'sensor_graph' not in response:
+            raise RuntimeError("Polling stopped without a graph: {}".format(response['graph_progress']['children']))
+        return response
+
+    def visit(self, n_nodes : int):
+        self.openPage()
+        for node in random.sample(self.nodes, min(n_nodes, len(self.nodes))):
+            self.graphNode(node)
+
+# returns the nodes the home page lets visitors pick
+def listNodes(url : str) -> list:
+    page = callback(url, [('content-div', 'children')], [('main_dropdown', 'value', 'Home'), ('warmup_interval', 'disabled', True)])
+    return [option['value'] for option in findComponent(page, 'node_dropdown')['props']['options']]
+
+# has concurrency visitors use the app at once until visits visits were made, returns the timings of every request and how long it took
+def runLoad(url : str, visits : int, concurrency : int, nodes_per_visit : int, vary_width : bool):
+    nodes = listNodes(url)
+    timings = list()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for result in [executor.submit(Visitor(url, nodes, timings, vary_width).visit, nodes_per_visit) for _ in range(visits)]:
+            result.result()
+    return timings, time.perf_counter() - start
+
+# summarises the timings of each kind of request: how many were made, how many failed and their latencies in milliseconds
+def summarise(timings : list, elapsed : float) -> pd.DataFrame:
+    df = pd.DataFrame(timings, columns=['request', 'seconds', 'failed'])
+    df = pd.concat([df, df.assign(request='all')])
+    summary = df.groupby('request').agg(requests=('seconds', 'size'), failed=('failed', 'sum'))
+    for name, quantile in [('p50 (ms)', 0.5), ('p95 (ms)', 0.95), ('p99 (ms)', 0.99)]:
+        summary[name] = df.groupby('request')['seconds'].quantile(quantile) * 1000
+    summary['requests/sec'] = summary['requests'] / elapsed
+    return summary.round(1)
+
+# starts run.py with the given arguments and waits until it serves the app, returns the process
+def startServer(port : int, run_args : list, timeout : float = 600) -> subprocess.Popen:
+    run_path = path.join(path.dirname(path.abspath(__file__)), 'run.py') # run from here, so it finds the data the same way
+    process = subprocess.Popen([sys.executable, run_path, '--port', str(port)] + run_args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("run.py {} exited with code {}".format(' '.join(run_args), process.returncode))
+        try:
+            request('http://127.0.0.1:{}/'.format(port), timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("run.py {} did not start serving within {} seconds".format(' '.join(run_args), timeout))
+
+def loadTest(name : str, url : str, args) -> pd.DataFrame:
+    print("Load testing the {} ({} visits, {} at once)...".format(name, args.visits, args.concurrency))
+    timings, elapsed = runLoad(url, args.visits, args.concurrency, args.nodes, args.vary_width)
+    summary = summarise(timings, elapsed)
+    print(summary.to_string())
+    print("{} requests in {:.1f}s\n".format(len(timings), elapsed))
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the app over http")
+    parser.add_argument('--url', default='http://127.0.0.1:8050', help="where the app is served")
+    parser.add_argument('--compare', action='store_true', help="start the development server and the production server (run.py --production) and load test both of them, instead of --url")
+    parser.add_argument('--visits', type=int, default=100, help="how many visits to make, each one opens the home page and graphs a few nodes")
+    parser.add_argument('--concurrency', type=int, default=16, help="how many visitors use the app at once")
+    parser.add_argument('--nodes', type=int, default=3, help="how many nodes each visitor graphs")
+    parser.add_argument('--vary-width', action='store_true', help="give every visitor a different graph width, so every graph has to be built")
+    parser.add_argument('--server-workers', type=int, help="with --compare, passed on to run.py --production")
+    parser.add_argument('--threads', type=int, help="with --compare, passed on to run.py --production")
+    parser.add_argument('--port', type=int, default=8060, help="with --compare, the development server is started on this port and the production server on the next one")
+    args = parser.parse_args()
+
+    if not args.compare:
+        loadTest('app at ' + args.url, args.url, args)
+        sys.exit()
+
+    production_args = ['--production']
+    if args.server_workers:
+        production_args += ['--server-workers', str(args.server_workers)]
+    if args.threads:
+        production_args += ['--threads', str(args.threads)]
+
+    results = dict()
+    for name, port, run_args in [('development server', args.port, []), ('production server', args.port + 1, production_args)]:
+        print("Starting the {}...".format(name))
+        server = startServer(port, run_args)
+        try:
+            results[name] = loadTest(name, 'http://127.0.0.1:{}'.format(port), args)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(pd.DataFrame({name : summary.loc['all', ['requests/sec', 'p50 (ms)', 'p95 (ms)', 'failed']] for name, summary in results.items()}).to_string())
\ No newline at end of file
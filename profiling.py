@@ -0,0 +1,125 @@
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource # only available on unix, used to report peak memory usage
+except ImportError:
+    resource = None
+
+# set this environment variable to profile startup, to the path the report should be written to ('-' prints it instead)
+PROFILE_ENV = 'AOT_PROFILE_STARTUP'
+
+# everything the profiler recorded, see buildReport
+PROFILE = {
+    'enabled' : False,
+    'output' : None,
+    'start' : time.perf_counter(), # roughly when the process started, this module is imported before anything heavy
+    'imports' : list(),
+    'phases' : list()
+}
+PROFILE_LOCK = threading.Lock() # phases can be recorded by the warm up thread and request threads at the same time
+
+# returns the peak memory usage of the process so far in MiB, or None if it can not be measured on this platform
+def peakMemory() -> float:
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # ru_maxrss is in kilobytes on linux
+
+# starts recording startup phases, the report is written to output ('-' prints it) once the warm up is done (see writeReport)
+def enableProfiling(output : str = '-'):
+    PROFILE['enabled'] = True
+    PROFILE['output'] = output
+
+def isProfiling() -> bool:
+    return PROFILE['enabled']
+
+# times a phase of startup (only while profiling), phases can be nested
+@contextmanager
+def profilePhase(name : str):
+    if not PROFILE['enabled']:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phase = {
+            'phase' : name,
+            'start' : round(start - PROFILE['start'], 6),
+            'seconds' : round(time.perf_counter() - start, 6),
+            'peak_rss_mib' : peakMemory(),
+            'thread' : threading.current_thread().name
+        }
+        with PROFILE_LOCK:
+            PROFILE['phases'].append(phase)
+
+# decorates a function so every call to it is timed as a phase of startup (see profilePhase)
+def profiled(name : str):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILE['enabled']:
+                return function(*args, **kwargs)
+            with profilePhase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# imports each of the modules, timing how long each one takes (including the modules it imports that were not imported yet)
+# call this before anything else imports them, modules that were already imported take no time
+def profileImports(modules : list):
+    for module in modules:
+        already_imported = module in sys.modules
+        start = time.perf_counter()
+        importlib.import_module(module)
+        PROFILE['imports'].append({
+            'module' : module,
+            'seconds' : round(time.perf_counter() - start, 6),
+            'already_imported' : already_imported
+        })
+
+# returns the startup report: every import and phase that was timed, in order, plus the total time spent in each phase
+def buildReport() -> dict:
+    with PROFILE_LOCK:
+        phases = list(PROFILE['phases'])
+
+    totals = dict()
+    for phase in phases:
+        total = totals.setdefault(phase['phase'], {'calls' : 0, 'seconds' : 0.0})
+        total['calls'] += 1
+        total['seconds'] = round(total['seconds'] + phase['seconds'], 6)
+
+    return {
+        'generated' : datetime.now().isoformat(timespec='seconds'),
+        'pid' : os.getpid(),
+        'python' : sys.version.split()[0],
+        'total_seconds' : round(time.perf_counter() - PROFILE['start'], 6),
+        'peak_rss_mib' : peakMemory(),
+        'imports' : list(PROFILE['imports']),
+        'phases' : sorted(phases, key=lambda phase : phase['start']),
+        'totals' : totals
+    }
+
+# writes the startup report (see buildReport) as json, if profiling is enabled
+def writeReport():
+    if not PROFILE['enabled']:
+        return
+
+    report = json.dumps(buildReport(), indent=2)
+    if PROFILE['output'] in ('-', '1'):
+        print(report)
+    else:
+        with open(PROFILE['output'], 'w') as f:
+            f.write(report)
+        print("Wrote startup profile to {}".format(PROFILE['output']))
+
+if os.environ.get(PROFILE_ENV):
+    enableProfiling(os.environ[PROFILE_ENV])
\ No newline at end of file
@@ -1,10 +1,80 @@
-# get data
-from data_parser import getData
+import argparse
 
-# initialize dash app
-from DashApp.app import app
-import DashApp.index
+from profiling import PROFILE_ENV, enableProfiling, isProfiling, profileImports, profilePhase
+
+# the third party modules the app imports, timed on their own when profiling startup
+STARTUP_MODULES = ['numpy', 'pandas', 'tables', 'pyarrow', 'plotly.graph_objects', 'dash', 'dash_core_components', 'dash_html_components']
 
 if __name__ == "__main__":
-    getData() # cache data so the graphs are responsive
-    app.run_server(debug=True, use_reloader=False, dev_tools_hot_reload=False)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the CS 395 analysis question app")
+    parser.add_argument('--workers', type=int, default=1, help="number of processes used to preprocess the data when there is no cache")
+    parser.add_argument('--cache-format', default='hdf5', choices=['hdf5', 'parquet'], help="format the preprocessed data is cached in")
+    parser.add_argument('--shared', action='store_true', help="open the data from a memory mapped snapshot that is shared by every process serving the app")
+    parser.add_argument('--invalidate-day', action='append', default=[], metavar='YYYY-MM-DD', help="remove a day from the cache and preprocess it again (can be given more than once)")
+    parser.add_argument('--background', action='store_true', help="start serving right away and load the data in the background, showing a loading page until it is ready")
+    parser.add_argument('--result-cache', metavar='URL', help="share the graphs and maps computed by every process serving the app through disk:PATH or redis://HOST:PORT/DB, same as setting AOT_RESULT_CACHE (with --production, disk is used if neither is given)")
+    parser.add_argument('--graph-workers', type=int, default=0, help="build the sensor graphs in this many background processes, so slow graphs do not hold up the other callbacks and can be cancelled (0 builds them while handling the request)")
+    parser.add_argument('--host', default='127.0.0.1', help="address to serve the app on")
+    parser.add_argument('--port', type=int, default=8050, help="port to serve the app on")
+    parser.add_argument('--production', action='store_true', help="serve the app with gunicorn instead of the flask development server: the data is loaded first, then shared by every worker process")
+    parser.add_argument('--server-workers', type=int, default=None, metavar='N', help="with --production, number of worker processes serving requests (default: one per cpu, at least 2)")
+    parser.add_argument('--threads', type=int, default=None, metavar='N', help="with --production, number of requests each worker process handles at once (default: 4)")
+    parser.add_argument('--timeout', type=int, default=None, metavar='SECONDS', help="with --production, how long a worker can spend on a request before it is restarted (default: 120)")
+    parser.add_argument('--profile-startup', nargs='?', const='-', metavar='PATH', help="time every phase of startup and the modules it imports, and write a json report to PATH (prints it if no PATH is given) once the app is warmed up, same as setting {}".format(PROFILE_ENV))
+    args = parser.parse_args()
+    if args.production and args.background:
+        parser.error("--background can not be used with --production, the data has to be loaded before the workers are started to be shared by them")
+
+    if args.profile_startup:
+        enableProfiling(args.profile_startup)
+    if isProfiling():
+        profileImports(STARTUP_MODULES) # before anything else imports them
+
+    # get data
+    from data_parser import getData, invalidateDay
+    from data_rollups import getRollups
+    from data_catalog import getCatalog, getNodeSummary
+    from DashApp.warmup import registerWarmup, runWarmup, startWarmup
+
+    for day in args.invalidate_day:
+        invalidateDay(day, cache_format=args.cache_format)
+
+    # cache data so the graphs are responsive (each page is built the first time it is opened, see DashApp.index)
+    registerWarmup("Loading the dataset", lambda: getData(workers=args.workers, cache_format=args.cache_format, shared=args.shared))
+    registerWarmup("Building rollups", getRollups) # used by the graphs for long time spans, only rebuilt if the data changed
+    registerWarmup("Building the sensor catalog", getCatalog)
+    registerWarmup("Summarising the nodes", getNodeSummary) # used by the map on every page
+
+    # initialize dash app (importing the pages only registers their callbacks)
+    with profilePhase("Importing the app and registering callbacks"):
+        from DashApp.app import app
+        import DashApp.index
+
+    from DashApp.jobs import configureJobs
+    configureJobs(args.graph_workers, dict(cache_format=args.cache_format, shared=args.shared)) # each worker opens the data like the app does
+
+    from DashApp.result_cache import configureResultCache, sharesResults
+    if args.result_cache:
+        configureResultCache(args.result_cache)
+    elif args.production and not sharesResults():
+        configureResultCache('disk') # a page checks on its graph in whichever worker gets the request, which needs what the others built
+
+    # when profiling, build every page up front so the report shows what each of them costs
+    # in production, so the workers share them instead of each building them
+    if isProfiling() or args.production:
+        for value, label, module in DashApp.index.PAGES:
+            registerWarmup("Building the {} page".format(label), DashApp.index.page_modules[value].getLayout)
+
+    if args.background:
+        startWarmup()
+    else:
+        runWarmup()
+
+    if args.production:
+        from DashApp.serving import serveProduction, DEFAULT_SERVER_WORKERS, DEFAULT_SERVER_THREADS, DEFAULT_SERVER_TIMEOUT
+        serveProduction(app.server, args.host, args.port,
+                        workers=args.server_workers or DEFAULT_SERVER_WORKERS,
+                        threads=args.threads or DEFAULT_SERVER_THREADS,
+                        timeout=args.timeout or DEFAULT_SERVER_TIMEOUT)
+    else:
+        app.run_server(host=args.host, port=args.port, debug=True, use_reloader=False, dev_tools_hot_reload=False)
\ No newline at end of file
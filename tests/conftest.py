@@ -0,0 +1,7 @@
+import os.path as path
+import sys
+
+PROJECT_ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
\ No newline at end of file
@@ -0,0 +1,90 @@
+# both cache formats (see data_cache.CACHE_FORMATS) have to give back the same measurements for the same query,
+# whichever of them the data is read from (see data_parser.loadData), and a memory mapped snapshot of the data
+# (see data_cache.writeSnapshot) has to give back exactly the frame it was written from
+import os
+import os.path as path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_cache import CACHE_FORMATS, compactFrame, openCache, openSnapshot, snapshotVersion, writeSnapshot, PROCESSED_COLUMNS
+from data_filters import sortData
+from data_parser import loadData
+
+NODES = ['001e0610ee36', '001e06113acb', '001e0611441e']
+PATHS = [('lightsense', 'hih4030', 'humidity'), ('metsense', 'htu21d', 'temperature')]
+
+# three days of measurements from every node, every half hour, with a few missing values
+def measurements() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    rows = list()
+    for time in pd.date_range('2020-08-24', periods=3 * 48, freq='30min'):
+        for i, node_id in enumerate(NODES):
+            for sensor_path in PATHS:
+                rows.append((time, 'AoT Chicago (S)', node_id, 41.87 + i / 100, -87.62, '{} St Chicago IL'.format(i), *sensor_path, rng.normal(20, 5)))
+    df = pd.DataFrame(rows, columns=PROCESSED_COLUMNS)
+    df.loc[::17, 'value_hrf'] = np.nan
+    return sortData(compactFrame(df))
+
+# the measurements written to a cache of each format, in batches that split the days up like the app writes them
+@pytest.fixture
+def caches(tmp_path) -> dict:
+    df = measurements()
+    caches = dict()
+    for cache_format in CACHE_FORMATS:
+        cache = openCache(cache_format, path.join(tmp_path, 'preprocessed_data.' + cache_format))
+        cache.write([df.iloc[:len(df) // 3], df.iloc[len(df) // 3:]])
+        caches[cache_format] = cache
+    return caches
+
+@pytest.mark.parametrize('query', [
+    dict(),
+    dict(columns=['timestamp', 'node_id', 'value_hrf']),
+    dict(node_ids=['001e06113acb']),
+    dict(start='2020-08-25', end='2020-08-25'),
+    dict(columns=['timestamp', 'sensor', 'value_hrf'], node_ids=['001e0610ee36', '001e0611441e'], start='2020-08-25', end='2020-08-26')
+])
+def test_formats_load_the_same_rows(caches, query):
+    loaded = {cache_format : loadData(processed_data_path=cache.path, cache_format=cache_format, **query) for cache_format, cache in caches.items()}
+
+    expected = measurements()
+    if 'node_ids' in query:
+        expected = expected[expected['node_id'].isin(query['node_ids'])]
+    if 'start' in query:
+        days = expected['timestamp'].dt.normalize()
+        expected = expected[(days >= query['start']) & (days <= query['end'])]
+    expected = expected[query.get('columns', PROCESSED_COLUMNS)]
+
+    for cache_format, df in loaded.items():
+        assert list(df.columns) == list(expected.columns), cache_format
+        df = df.sort_values(list(df.columns)).reset_index(drop=True)
+        pd.testing.assert_frame_equal(df, expected.sort_values(list(df.columns)).reset_index(drop=True), check_categorical=False, obj=cache_format)
+
+def test_snapshot_gives_back_the_frame(tmp_path):
+    df = measurements()
+    snapshot_path = path.join(tmp_path, 'snapshot.mmap')
+    writeSnapshot(df, snapshot_path, version='1234')
+
+    assert snapshotVersion(snapshot_path) == '1234'
+    pd.testing.assert_frame_equal(openSnapshot(snapshot_path), df.reset_index(drop=True))
+
+def test_snapshot_is_read_only(tmp_path):
+    snapshot_path = path.join(tmp_path, 'snapshot.mmap')
+    writeSnapshot(measurements(), snapshot_path, version='1234')
+    df = openSnapshot(snapshot_path)
+
+    assert isinstance(df['value_hrf'].to_numpy().base, np.memmap)
+    with pytest.raises(ValueError):
+        df['value_hrf'].to_numpy()[0] = 0
+
+def test_snapshot_is_replaced(tmp_path):
+    df = measurements()
+    snapshot_path = path.join(tmp_path, 'snapshot.mmap')
+    assert snapshotVersion(snapshot_path) is None
+
+    writeSnapshot(df, snapshot_path, version='1')
+    writeSnapshot(df.iloc[:10], snapshot_path, version='2')
+    assert snapshotVersion(snapshot_path) == '2'
+    assert len(openSnapshot(snapshot_path)) == 10
+    assert os.listdir(tmp_path) == ['snapshot.mmap'] # no temporary or old snapshots left behind
\ No newline at end of file
@@ -0,0 +1,88 @@
+# the catalog, node summary and presence bitmap are built from the index instead of scanning the data,
+# these check them against what scanning the data finds
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_catalog
+from data_cache import PROCESSED_COLUMNS, compactFrame
+from data_catalog import buildCatalog, buildNodeSummary, buildPresence, listNodesReporting
+from data_filters import indexData
+
+DAYS = [datetime.date(2020, 8, 24), datetime.date(2020, 8, 25), datetime.date(2020, 8, 26), datetime.date(2020, 8, 27)]
+
+# the sensor paths each node measured, and on which of DAYS (by position)
+REPORTS = {
+    ('001e0610ee36', 'lightsense', 'hih4030', 'humidity') : [0, 1, 2, 3],
+    ('001e0610ee36', 'metsense', 'htu21d', 'temperature') : [0, 1],
+    ('001e0610ee36', 'metsense', 'bmp180', 'pressure') : [3],
+    ('001e06113acb', 'chemsense', 'co', 'concentration') : [2],
+    ('001e06113acb', 'metsense', 'htu21d', 'temperature') : [1, 2]
+}
+
+# every path measured every hour on the days it reported, in no particular order
+@pytest.fixture(scope='module')
+def data() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    rows = list()
+    for sensor_path, days in REPORTS.items():
+        for day in days:
+            for time in pd.date_range(pd.Timestamp(DAYS[day]), periods=24, freq='1h'):
+                rows.append((time,) + sensor_path)
+    df = pd.DataFrame(rows, columns=['timestamp', 'node_id', 'subsystem', 'sensor', 'parameter'])
+    df['description'] = 'AoT Chicago (S)'
+    df['latitude'] = df['node_id'].map({'001e0610ee36' : 41.87, '001e06113acb' : 41.75})
+    df['longitude'] = -87.62
+    df['address'] = df['node_id'] + ' St Chicago IL'
+    df['value_hrf'] = rng.normal(20, 5, len(df))
+    return compactFrame(df[PROCESSED_COLUMNS].iloc[rng.permutation(len(df))].reset_index(drop=True))
+
+@pytest.fixture(scope='module')
+def catalog(data) -> dict:
+    return buildCatalog(indexData(data))
+
+def test_catalog_holds_every_sensor_path(data, catalog):
+    for (node_id, subsystem, sensor, parameter), days in REPORTS.items():
+        stats = catalog[node_id][subsystem][sensor][parameter]
+        assert stats['rows'] == 24 * len(days)
+        assert stats['first'] == pd.Timestamp(DAYS[days[0]])
+        assert stats['last'] == pd.Timestamp(DAYS[days[-1]]) + pd.Timedelta(hours=23)
+
+    assert sum(len(parameters) for sensors in catalog.values() for subsystem in sensors.values() for parameters in subsystem.values()) == len(REPORTS)
+
+def test_node_summary(data, catalog):
+    summary = buildNodeSummary(data, catalog)
+
+    assert sorted(summary.index) == ['001e0610ee36', '001e06113acb']
+    node = summary.loc['001e06113acb']
+    assert node['latitude'] == pytest.approx(41.75)
+    assert node['address'] == '001e06113acb St Chicago IL'
+    assert sorted(node['subsystems']) == ['chemsense', 'metsense']
+    assert node['first_seen'] == pd.Timestamp(DAYS[1])
+    assert node['last_seen'] == pd.Timestamp(DAYS[2]) + pd.Timedelta(hours=23)
+
+def test_presence_matches_the_days_each_subsystem_reported(data):
+    presence = buildPresence(data)
+
+    assert list(presence['days']) == [pd.Timestamp(day) for day in DAYS]
+    for row, (node_id, subsystem) in enumerate(presence['groups']):
+        days = {day for sensor_path, path_days in REPORTS.items() if sensor_path[:2] == (node_id, subsystem) for day in path_days}
+        assert list(np.flatnonzero(presence['present'][row])) == sorted(days)
+
+@pytest.mark.parametrize('start, end, expected', [
+    (DAYS[0], DAYS[0], {'001e0610ee36' : ['lightsense', 'metsense']}),
+    (DAYS[2], DAYS[2], {'001e0610ee36' : ['lightsense'], '001e06113acb' : ['chemsense', 'metsense']}),
+    (DAYS[3], DAYS[3], {'001e0610ee36' : ['lightsense', 'metsense']}),
+    (DAYS[1], DAYS[2], {'001e0610ee36' : ['lightsense', 'metsense'], '001e06113acb' : ['chemsense', 'metsense']}),
+    (datetime.date(2020, 9, 1), datetime.date(2020, 9, 30), dict()) # after the data ends
+])
+def test_nodes_reporting(monkeypatch, data, start, end, expected):
+    monkeypatch.setattr(data_catalog, 'PRESENCE', buildPresence(data)) # as if getPresence had built it from this data
+    reporting = listNodesReporting(start, end)
+    assert {node_id : sorted(subsystems) for node_id, subsystems in reporting.items()} == expected
+
+def test_presence_of_no_data(data):
+    presence = buildPresence(data.iloc[0:0])
+    assert len(presence['days']) == 0 and presence['present'].shape[1] == 0
\ No newline at end of file
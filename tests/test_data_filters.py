@@ -0,0 +1,79 @@
+# the filters in data_filters look rows up in the index of an indexed frame (see indexData), and compare every row of any other
+# frame, these check that both ways find the same rows
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_cache import PROCESSED_COLUMNS, compactFrame
+from data_filters import SORT_COLUMNS, indexData, lookupIndex, takeScanned, filterByNodeId, filterBySensorPath, filterByDay, filterByDateRange
+
+NODES = ['001e0610ee36', '001e06113acb', '001e061183f5']
+PATHS = [('lightsense', 'hih4030', 'humidity'), ('metsense', 'htu21d', 'temperature'), ('metsense', 'htu21d', 'humidity'), ('metsense', 'bmp180', 'pressure')]
+DAYS = [datetime.date(2020, 8, 24), datetime.date(2020, 8, 25), datetime.date(2020, 8, 26)]
+
+# a few nodes, each measuring a few sensor paths every 10 minutes over a few days, in no particular order
+@pytest.fixture(scope='module')
+def data() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    times = pd.date_range(pd.Timestamp(DAYS[0]), pd.Timestamp(DAYS[-1]) + pd.Timedelta(days=1), freq='10min', inclusive='left')
+    rows = [(time, node_id) + path for node_id in NODES for path in PATHS for time in times]
+    df = pd.DataFrame(rows, columns=['timestamp', 'node_id', 'subsystem', 'sensor', 'parameter'])
+    df['description'] = 'AoT Chicago (S)'
+    df['latitude'] = 41.878377
+    df['longitude'] = -87.627678
+    df['address'] = df['node_id'] + ' St Chicago IL'
+    df['value_hrf'] = rng.normal(20, 5, len(df))
+    return compactFrame(df[PROCESSED_COLUMNS].iloc[rng.permutation(len(df))].reset_index(drop=True))
+
+@pytest.fixture(scope='module')
+def indexed(data) -> pd.DataFrame:
+    return indexData(data)
+
+def assertSameRows(found : pd.DataFrame, expected : pd.DataFrame):
+    assert len(found) > 0
+    found = found.sort_values(SORT_COLUMNS).reset_index(drop=True)
+    expected = expected.sort_values(SORT_COLUMNS).reset_index(drop=True)
+    pd.testing.assert_frame_equal(found, expected)
+
+def test_indexed_frame_has_an_index(data, indexed):
+    assert lookupIndex(indexed) is not None
+    assert lookupIndex(data) is None
+
+@pytest.mark.parametrize('node_id', NODES)
+def test_filter_by_node_id(data, indexed, node_id):
+    takeScanned()
+    found = filterByNodeId(indexed, node_id)
+    assert takeScanned() == len(found) # looked up, rather than compared with every row
+    assertSameRows(found, filterByNodeId(data, node_id))
+
+@pytest.mark.parametrize('subsystem, sensor, parameter', [
+    ('metsense', None, None),
+    ('metsense', 'htu21d', None),
+    ('metsense', 'htu21d', 'humidity'),
+    (None, None, 'humidity'), # not a prefix of the sensor path, so the index can not be used
+    (None, 'htu21d', None)
+])
+def test_filter_by_sensor_path(data, indexed, subsystem, sensor, parameter):
+    assertSameRows(filterBySensorPath(indexed, subsystem, sensor, parameter), filterBySensorPath(data, subsystem, sensor, parameter))
+
+@pytest.mark.parametrize('day', DAYS)
+def test_filter_by_day(data, indexed, day):
+    # a single sensor path of a node is sorted by time, so the day is found with a binary search
+    assertSameRows(filterByDay(filterBySensorPath(filterByNodeId(indexed, NODES[1]), *PATHS[1]), day),
+                   filterByDay(filterBySensorPath(filterByNodeId(data, NODES[1]), *PATHS[1]), day))
+    assertSameRows(filterByDay(indexed, day), filterByDay(data, day))
+
+@pytest.mark.parametrize('start, end', [(DAYS[0], DAYS[0]), (DAYS[0], DAYS[1]), (DAYS[1], DAYS[2])])
+def test_filter_by_date_range(data, indexed, start, end):
+    assertSameRows(filterByDateRange(filterBySensorPath(filterByNodeId(indexed, NODES[2]), *PATHS[3]), start, end),
+                   filterByDateRange(filterBySensorPath(filterByNodeId(data, NODES[2]), *PATHS[3]), start, end))
+    assertSameRows(filterByDateRange(indexed, start, end), filterByDateRange(data, start, end))
+
+def test_chained_filters_stay_indexed(indexed):
+    node_df = filterByNodeId(indexed, NODES[0])
+    path_df = filterBySensorPath(node_df, *PATHS[2])
+    assert lookupIndex(node_df) is not None
+    assert lookupIndex(path_df) is not None
+    assert (path_df['parameter'] == PATHS[2][2]).all() and (path_df['node_id'] == NODES[0]).all()
\ No newline at end of file
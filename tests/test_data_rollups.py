@@ -0,0 +1,82 @@
+# a rollup has to hold the same count, mean, min, max and sum of squares per sensor path and bucket as grouping the raw
+# measurements would, and the graphs use the coarsest rollup that still fills the plot
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_rollups
+from data_cache import PROCESSED_COLUMNS, compactFrame
+from data_filters import PATH_COLUMNS, filterByNodeId, indexData
+from data_rollups import ROLLUP_COLUMNS, ROLLUP_RESOLUTIONS, buildRollup, pickRollup
+
+NODES = ['001e0610ee36', '001e06113acb']
+PATHS = [('lightsense', 'hih4030', 'humidity'), ('metsense', 'htu21d', 'temperature')]
+
+# two nodes measuring two sensor paths at irregular times over a day, in no particular order, with a few missing values
+@pytest.fixture(scope='module')
+def data() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    rows = list()
+    for node_id in NODES:
+        for sensor_path in PATHS:
+            for seconds in np.sort(rng.integers(0, 24 * 60 * 60, 2000)):
+                rows.append((pd.Timestamp('2020-08-24') + pd.Timedelta(seconds=int(seconds)), node_id) + sensor_path)
+    df = pd.DataFrame(rows, columns=['timestamp', 'node_id', 'subsystem', 'sensor', 'parameter'])
+    df['description'] = 'AoT Chicago (S)'
+    df['latitude'] = 41.878377
+    df['longitude'] = -87.627678
+    df['address'] = 'State St Chicago IL'
+    df['value_hrf'] = rng.normal(20, 5, len(df))
+    df.loc[::13, 'value_hrf'] = np.nan
+    return compactFrame(df[PROCESSED_COLUMNS].iloc[rng.permutation(len(df))].reset_index(drop=True))
+
+# what grouping the measurements by sensor path and bucket gives
+def groupedRollup(df : pd.DataFrame, resolution : pd.Timedelta) -> pd.DataFrame:
+    df = df.dropna(subset=['value_hrf']).astype({column : str for column in PATH_COLUMNS})
+    values = df['value_hrf'].astype(np.float64)
+    grouped = values.groupby([df['timestamp'].dt.floor(resolution)] + [df[column] for column in PATH_COLUMNS])
+    expected = pd.DataFrame({
+        'count' : grouped.count(),
+        'mean' : grouped.mean(),
+        'min' : grouped.min(),
+        'max' : grouped.max(),
+        'sumsq' : (values * values).groupby([df['timestamp'].dt.floor(resolution)] + [df[column] for column in PATH_COLUMNS]).sum()
+    })
+    return expected.reset_index().sort_values(PATH_COLUMNS + ['timestamp']).reset_index(drop=True)
+
+@pytest.mark.parametrize('name', list(ROLLUP_RESOLUTIONS))
+def test_rollup_matches_grouping_the_measurements(data, name):
+    rollup = buildRollup(indexData(data), ROLLUP_RESOLUTIONS[name])
+    expected = groupedRollup(data, ROLLUP_RESOLUTIONS[name])
+
+    assert list(rollup.columns) == ROLLUP_COLUMNS
+    rollup = rollup.astype({column : str for column in PATH_COLUMNS}).sort_values(PATH_COLUMNS + ['timestamp']).reset_index(drop=True)
+    assert len(rollup) == len(expected)
+    assert (rollup['timestamp'] == expected['timestamp']).all()
+    for column in PATH_COLUMNS:
+        assert (rollup[column] == expected[column]).all()
+    assert (rollup['count'] == expected['count']).all()
+    for column in ['mean', 'min', 'max', 'sumsq']:
+        np.testing.assert_allclose(rollup[column], expected[column], rtol=1e-6)
+
+def test_rollup_of_filtered_rows(data):
+    # the rows of one node keep the offsets of the frame they came from, so the rollup has to index them again
+    node_rows = filterByNodeId(indexData(data), NODES[1])
+    rollup = buildRollup(node_rows, ROLLUP_RESOLUTIONS['1h'])
+    assert rollup['count'].sum() == node_rows['value_hrf'].notna().sum()
+    assert set(rollup['node_id'].astype(str)) == {NODES[1]}
+
+def test_rollup_of_no_measurements(data):
+    rollup = buildRollup(indexData(data.iloc[0:0]), ROLLUP_RESOLUTIONS['1h'])
+    assert len(rollup) == 0 and list(rollup.columns) == ROLLUP_COLUMNS
+
+@pytest.mark.parametrize('span, points, name', [
+    (pd.Timedelta(days=60), 1000, '1h'),
+    (pd.Timedelta(days=7), 1000, '5min'),
+    (pd.Timedelta(days=1), 1000, '1min'),
+    (pd.Timedelta(hours=6), 1000, None) # fewer minutes than points, so the raw measurements are graphed
+])
+def test_pick_rollup(monkeypatch, span, points, name):
+    rollups = {rollup_name : 'rollup ' + rollup_name for rollup_name in ROLLUP_RESOLUTIONS}
+    monkeypatch.setattr(data_rollups, 'AOT_ROLLUPS', rollups) # as if getRollups had built them already
+    assert pickRollup(span, points) == (None if name is None else (name, rollups[name]))
\ No newline at end of file
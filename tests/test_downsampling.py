@@ -0,0 +1,54 @@
+# a downsampled series has to keep the points a reader would miss (its first and last, its peaks) while staying within the
+# number of points it was given, and never keep a point that would not be drawn
+import numpy as np
+import pytest
+
+from downsampling import downsample, lttb, minMax
+
+# a noisy sine wave with one spike in the middle, and a few measurements missing
+def series(n : int = 1000):
+    rng = np.random.default_rng(0)
+    x = np.arange(n, dtype='float64')
+    y = np.sin(x / 50) + rng.normal(0, 0.1, n)
+    y[n // 2] = 10
+    y[::97] = np.nan
+    return x, y
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_keeps_at_most_n_out_valid_points_in_order(method):
+    x, y = series()
+    kept = downsample(x, y, 100, method)
+
+    assert 0 < len(kept) <= 100
+    assert np.all(np.diff(kept) > 0)
+    assert not np.isnan(y[kept]).any()
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_keeps_the_spike(method):
+    x, y = series()
+    assert len(x) // 2 in downsample(x, y, 100, method)
+
+def test_lttb_keeps_the_first_and_last_point():
+    x, y = series()
+    kept = lttb(x, y, 50)
+    assert len(kept) == 50 and kept[0] == 0 and kept[-1] == len(x) - 1
+
+def test_minmax_keeps_the_extremes_of_each_bucket():
+    y = np.array([0, 5, -3, 1, 2, 8, 7, -1], dtype='float64')
+    assert list(minMax(y, 4)) == [1, 2, 5, 7]
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax', None])
+def test_keeps_every_valid_point_when_there_are_few_enough(method):
+    x, y = series(50)
+    valid = np.flatnonzero(~np.isnan(y))
+    assert list(downsample(x, y, len(valid), method)) == list(valid)
+    assert list(downsample(x, y, 1000, method)) == list(valid)
+
+def test_nan_only_series_keeps_nothing():
+    x = np.arange(10, dtype='float64')
+    assert len(downsample(x, np.full(10, np.nan), 5)) == 0
+
+def test_unknown_method():
+    x, y = series()
+    with pytest.raises(ValueError):
+        downsample(x, y, 100, 'every_other')
\ No newline at end of file
@@ -0,0 +1,64 @@
+# the figure cache keeps at most max_entries figures, forgets each one ttl seconds after it was stored,
+# and forgets all of them once the data they were built from changes
+import time
+
+import pytest
+
+from DashApp.figure_cache import FigureCache
+
+# a clock the test moves forward itself, instead of waiting for figures to expire
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    return now
+
+def test_stores_figures(clock):
+    cache = FigureCache('test')
+    assert cache.get(('a',), 'v1') is None
+    cache.put(('a',), 'v1', '{"a": 1}')
+    assert cache.get(('a',), 'v1') == '{"a": 1}'
+    assert cache.stats() == {'entries' : 1, 'hits' : 1, 'misses' : 1}
+
+def test_figures_expire_after_ttl(clock):
+    cache = FigureCache('test', ttl=60)
+    cache.put(('a',), 'v1', 'a')
+
+    clock[0] += 59
+    assert cache.get(('a',), 'v1') == 'a'
+    clock[0] += 2
+    assert cache.get(('a',), 'v1') is None
+    assert cache.stats()['entries'] == 0
+
+def test_evicts_the_least_recently_used_figure(clock):
+    cache = FigureCache('test', max_entries=2)
+    cache.put(('a',), 'v1', 'a')
+    cache.put(('b',), 'v1', 'b')
+    assert cache.get(('a',), 'v1') == 'a' # so b is now the least recently used
+
+    cache.put(('c',), 'v1', 'c')
+    assert cache.get(('b',), 'v1') is None
+    assert cache.get(('a',), 'v1') == 'a'
+    assert cache.get(('c',), 'v1') == 'c'
+
+def test_storing_a_figure_again_refreshes_it(clock):
+    cache = FigureCache('test', max_entries=2, ttl=60)
+    cache.put(('a',), 'v1', 'a')
+    cache.put(('b',), 'v1', 'b')
+    clock[0] += 30
+    cache.put(('a',), 'v1', 'a2')
+
+    clock[0] += 45 # b has expired, a was stored again since
+    assert cache.get(('a',), 'v1') == 'a2'
+    assert cache.get(('b',), 'v1') is None
+
+def test_a_new_data_version_empties_the_cache(clock):
+    cache = FigureCache('test')
+    cache.put(('a',), 'v1', 'a')
+    cache.put(('b',), 'v1', 'b')
+
+    assert cache.get(('a',), 'v2') is None
+    assert cache.stats()['entries'] == 0
+    cache.put(('a',), 'v2', 'a2')
+    assert cache.get(('a',), 'v2') == 'a2'
+    assert cache.get(('a',), 'v1') is None # an old version empties it again, rather than giving back a newer figure
\ No newline at end of file
@@ -0,0 +1,74 @@
+# gunicorn forks the processes serving the app from one that already imported it (see DashApp.serving), so polls for a job
+# can reach a process other than the one that submitted it, which must never answer with a job of its own
+import multiprocessing
+import os
+from concurrent.futures import Future
+
+import pytest
+
+from DashApp import jobs
+from DashApp.metrics import JOB_ROWS
+from data_filters import countScanned
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="only processes that are forked inherit the jobs module")
+
+# what a forked process serving the app does: submits a job of its own, then checks on it and on a job another process submitted
+def serveAndPoll(other_job : str, results):
+    job_id = jobs.finishedJob('figure of {}'.format(os.getpid()))
+    results.put((job_id, jobs.pollJob(job_id), None if other_job is None else jobs.pollJob(other_job)))
+
+# runs serveAndPoll in a process forked from this one, returns what it put
+def forkAndPoll(other_job : str = None) -> tuple:
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=serveAndPoll, args=(other_job, results))
+    process.start()
+    result = results.get(timeout=60)
+    process.join()
+    return result
+
+def test_forked_processes_number_their_own_jobs():
+    first_job, first_poll, _ = forkAndPoll()
+    second_job, second_poll, cross_poll = forkAndPoll(first_job)
+
+    assert first_job != second_job
+    assert not first_job.startswith(jobs.JOB_PREFIX + '-') and not second_job.startswith(jobs.JOB_PREFIX + '-')
+    assert first_poll[0] == 'done' and second_poll[0] == 'done' and first_poll[1] != second_poll[1]
+    # the job is not this process's, so the page waits for the graph the other process shares (see DashApp.graphing.fetchSensorFigure)
+    # rather than this process answering with its own job or as if the job was cancelled
+    assert cross_poll is None
+
+def test_polls_cross_workers_of_a_preloaded_app():
+    # jobs the process had before forking are not the workers', whatever the workers number their own
+    parent_job = jobs.finishedJob('figure of the process that loaded the app')
+    worker_job, _, cross_poll = forkAndPoll(parent_job)
+    assert worker_job != parent_job
+    assert cross_poll is None
+    assert jobs.pollJob(worker_job) is None
+    assert jobs.pollJob(parent_job)[0] == 'done'
+
+# a job shares its result as soon as it is done (see DashApp.graphing.shareSensorFigure), whichever process the page checks on it in
+def test_finished_is_called_with_the_result():
+    finished = []
+    job_id = jobs.submitJob(sorted, [3, 1, 2], finished=lambda *outcome: finished.append(outcome))
+    assert finished == [(job_id, [1, 2, 3], None)]
+    assert jobs.pollJob(job_id) == ('done', [1, 2, 3])
+
+# what a job run in a worker does: scans some rows
+def scanRows(n_rows : int) -> str:
+    countScanned(n_rows)
+    return 'scanned {}'.format(n_rows)
+
+# the rows a job scans in a worker process are counted there, so they are sent back with its result and recorded once it is done
+def test_rows_scanned_by_a_worker_job_are_recorded():
+    countScanned(7) # scanned before the job, by whatever ran in the worker before it
+    future = Future()
+    future.set_result(jobs.runJob('job-1', 1, scanRows, (1234,)))
+    assert future.result() == ('scanned 1234', 1234)
+
+    finished = []
+    before = JOB_ROWS.series.get((('job', 'scanRows'),), ([], 0, 0))
+    jobs.reportFinished('job-1', scanRows, future, lambda *outcome: finished.append(outcome))
+    counts, total, count = JOB_ROWS.series[(('job', 'scanRows'),)]
+    assert (total - before[1], count - before[2]) == (1234, 1)
+    assert finished == [('job-1', 'scanned 1234', None)] # without the count
\ No newline at end of file
@@ -0,0 +1,59 @@
+# every callback registered on an instrumented app (see DashApp.metrics.instrumentApp) is counted and timed,
+# along with the rows it scanned, the points it returned and the size of its response, and all of it is served at /metrics
+import dash
+import dash_core_components as dcc
+import dash_html_components as html
+import pytest
+from dash.dependencies import Input, Output
+
+from DashApp.metrics import instrumentApp
+from data_filters import countScanned
+
+@pytest.fixture
+def client():
+    app = dash.Dash(__name__)
+    app.layout = html.Div([dcc.Input(id='points'), dcc.Graph(id='graph')])
+    instrumentApp(app)
+
+    @app.callback(Output('graph', 'figure'), [Input('points', 'value')])
+    def draw(points):
+        if points is None:
+            raise dash.exceptions.PreventUpdate()
+        countScanned(1000)
+        return {'data' : [{'x' : list(range(points)), 'y' : list(range(points))}]}
+
+    return app.server.test_client()
+
+def callDraw(client, points):
+    return client.post('/_dash-update-component', json={
+        'output' : 'graph.figure',
+        'outputs' : {'id' : 'graph', 'property' : 'figure'},
+        'inputs' : [{'id' : 'points', 'property' : 'value', 'value' : points}],
+        'changedPropIds' : ['points.value']
+    })
+
+# returns the value of each sample of the draw callback in the metrics, by the line up to its value
+def drawSamples(client) -> dict:
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    samples = dict()
+    for line in response.get_data(as_text=True).splitlines():
+        if 'callback="draw"' in line:
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+def test_metrics_of_a_callback(client):
+    assert callDraw(client, 250).status_code == 200
+    assert callDraw(client, None).status_code == 204
+
+    labels = 'callback="draw",output="graph.figure"'
+    samples = drawSamples(client)
+    assert samples['dash_callback_calls_total{callback="draw",outcome="ok",output="graph.figure"}'] == 1 # labels are in order
+    assert samples['dash_callback_calls_total{callback="draw",outcome="prevented",output="graph.figure"}'] == 1
+    assert samples['dash_callback_duration_seconds_count{{{}}}'.format(labels)] == 2
+    assert samples['dash_callback_rows_scanned_sum{{{}}}'.format(labels)] == 1000
+    assert samples['dash_callback_points_returned_sum{{{}}}'.format(labels)] == 250
+    assert samples['dash_callback_points_returned_bucket{{{},le="500"}}'.format(labels)] == 1
+    assert samples['dash_callback_points_returned_bucket{{{},le="100"}}'.format(labels)] == 0
+    assert samples['dash_callback_response_bytes_count{{{}}}'.format(labels)] == 1 # a prevented update sends nothing back
\ No newline at end of file
@@ -0,0 +1,121 @@
+# refreshing the cache a day at a time (see data_parser.refreshProcessedData) has to leave it holding exactly what building it
+# from scratch would, whatever happened to the source files in between
+import gzip
+import os
+import os.path as path
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_cache import openCache, readManifest
+from data_filters import sortData
+from data_parser import buildProcessedData, invalidateDay, refreshProcessedData, streamCompressedData
+
+NODES = ['001e0610ee36', '001e06113acb']
+PATHS = [('lightsense', 'hih4030', 'humidity'), ('metsense', 'htu21d', 'temperature')]
+
+# returns the csv lines of the measurements taken on a day, with values that depend on seed
+def dayLines(day : str, seed : int) -> list:
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(day, periods=48, freq='30min')
+    return ['{},{},{},{},{},NA,{:.2f}'.format(time.strftime('%Y/%m/%d %H:%M:%S'), node_id, *sensor_path, rng.normal(20, 5))
+            for time in times for node_id in NODES for sensor_path in PATHS]
+
+# writes the data file and its offsets file, days maps each day to the seed of its values
+def writeSources(directory, days : dict):
+    header = b'timestamp,node_id,subsystem,sensor,parameter,value_raw,value_hrf\n'
+    offsets = ['date,offset,size']
+    with open(path.join(directory, 'data.csv'), 'wb') as f:
+        f.write(header)
+        for day, seed in days.items():
+            block = ''.join(line + '\n' for line in dayLines(day, seed)).encode()
+            offsets.append('{},{},{}'.format(day, f.tell(), len(block)))
+            f.write(block)
+    with open(path.join(directory, 'offsets.csv'), 'w') as f:
+        f.write('\n'.join(offsets) + '\n')
+
+def writeNodes(directory):
+    lines = ['node_id,project_id,vsn,address,lat,lon,description,start_timestamp,end_timestamp']
+    lines += ['{},AoT_Chicago,00{},{} St Chicago IL,41.87,-87.62,AoT Chicago (S),2017/10/09 00:00:00,'.format(node_id, i, i) for i, node_id in enumerate(NODES)]
+    with open(path.join(directory, 'nodes.csv'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def sourcePaths(directory) -> tuple:
+    return tuple(path.join(directory, name) for name in ['data.csv', 'nodes.csv', 'offsets.csv'])
+
+# what building the cache from scratch gives for the same source files
+def freshBuild(directory, cache_format : str) -> pd.DataFrame:
+    cache = openCache(cache_format, path.join(directory, 'fresh.' + cache_format))
+    return buildProcessedData(cache, *sourcePaths(directory), workers=1)
+
+def assertSameData(found : pd.DataFrame, expected : pd.DataFrame):
+    found = sortData(found).reset_index(drop=True)
+    expected = sortData(expected).reset_index(drop=True)
+    pd.testing.assert_frame_equal(found, expected)
+
+@pytest.fixture(params=['hdf5', 'parquet'])
+def cache_format(request) -> str:
+    return request.param
+
+# a cache built from three days of measurements
+@pytest.fixture
+def cache(cache_format, tmp_path):
+    writeNodes(tmp_path)
+    writeSources(tmp_path, {'2020-08-24' : 0, '2020-08-25' : 1, '2020-08-26' : 2})
+    cache = openCache(cache_format, path.join(str(tmp_path), 'cache.' + cache_format))
+    buildProcessedData(cache, *sourcePaths(tmp_path), workers=1)
+    return cache
+
+def test_changed_day(cache, cache_format, tmp_path):
+    writeSources(tmp_path, {'2020-08-24' : 0, '2020-08-25' : 10, '2020-08-26' : 2})
+    assert refreshProcessedData(cache, *sourcePaths(tmp_path))
+    assertSameData(cache.read(), freshBuild(tmp_path, cache_format))
+    assert cache.rows() == readManifest(cache.path)['rows']
+
+def test_appended_day(cache, cache_format, tmp_path):
+    writeSources(tmp_path, {'2020-08-24' : 0, '2020-08-25' : 1, '2020-08-26' : 2, '2020-08-27' : 3})
+    assert refreshProcessedData(cache, *sourcePaths(tmp_path))
+    assertSameData(cache.read(), freshBuild(tmp_path, cache_format))
+    assert '2020-08-27' in readManifest(cache.path)['days']
+
+def test_removed_day(cache, cache_format, tmp_path):
+    writeSources(tmp_path, {'2020-08-24' : 0, '2020-08-26' : 2})
+    assert refreshProcessedData(cache, *sourcePaths(tmp_path))
+    assertSameData(cache.read(), freshBuild(tmp_path, cache_format))
+
+def test_invalidated_day(cache, cache_format, tmp_path):
+    invalidateDay('2020-08-25', cache.path, cache_format)
+    assert '2020-08-25' not in readManifest(cache.path)['days']
+    assert refreshProcessedData(cache, *sourcePaths(tmp_path))
+    assertSameData(cache.read(), freshBuild(tmp_path, cache_format))
+
+# replaces the data file with a gzipped copy, which the cache is then built from (see data_parser.streamCompressedData)
+def gzipData(directory):
+    data_path = path.join(directory, 'data.csv')
+    with open(data_path, 'rb') as f, gzip.open(data_path + '.gz', 'wb') as compressed:
+        shutil.copyfileobj(f, compressed)
+    os.remove(data_path)
+
+def test_streamed_batches(tmp_path):
+    writeNodes(tmp_path)
+    writeSources(tmp_path, {'2020-08-24' : 0, '2020-08-25' : 1})
+    expected = freshBuild(tmp_path, 'parquet')
+    gzipData(tmp_path)
+
+    batches = list(streamCompressedData(path.join(tmp_path, 'data.csv.gz'), path.join(tmp_path, 'nodes.csv'), chunksize=50))
+    assert len(batches) == -(-len(expected) // 50) and all(len(batch) <= 50 for batch in batches)
+    assertSameData(pd.concat(batches, ignore_index=True).astype(expected.dtypes.to_dict()), expected)
+
+def test_cache_built_from_gzipped_data(cache_format, tmp_path):
+    writeNodes(tmp_path)
+    writeSources(tmp_path, {'2020-08-24' : 0, '2020-08-25' : 1})
+    expected = freshBuild(tmp_path, cache_format)
+    gzipData(tmp_path)
+
+    cache = openCache(cache_format, path.join(str(tmp_path), 'cache.' + cache_format))
+    assertSameData(buildProcessedData(cache, *sourcePaths(tmp_path), workers=1), expected)
+    assertSameData(cache.read(), expected)
+    assert readManifest(cache.path)['rows'] == len(expected)
+    assert refreshProcessedData(cache, *sourcePaths(tmp_path)) # nothing changed, so it is not rebuilt
\ No newline at end of file
@@ -0,0 +1,122 @@
+# the results of callbacks are shared through redis with a small client of its own (see DashApp.result_cache.RedisCache),
+# so it is checked against a server that speaks enough of the redis protocol to answer it
+import socket
+import socketserver
+import threading
+
+import pytest
+
+from DashApp.result_cache import RedisCache, RedisError
+
+# answers GET, SET (remembering the EX it was given), AUTH and SELECT, and drops every connection when told to
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.handlers.append(self)
+        logged_in = server.password is None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for i in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+
+            command = args[0].upper()
+            server.commands.append(command)
+            if command == b'AUTH':
+                logged_in = args[1].decode() == server.password
+                self.wfile.write(b'+OK\r\n' if logged_in else b'-ERR invalid password\r\n')
+            elif not logged_in:
+                self.wfile.write(b'-NOAUTH Authentication required.\r\n')
+            elif command == b'SELECT':
+                self.wfile.write(b'+OK\r\n')
+            elif command == b'GET':
+                value = server.store.get(args[1])
+                self.wfile.write(b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value))
+            elif command == b'SET':
+                server.store[args[1]] = args[2]
+                if len(args) > 4 and args[3].upper() == b'EX':
+                    server.expiries[args[1]] = int(args[4])
+                self.wfile.write(b'+OK\r\n')
+            else:
+                self.wfile.write(b'-ERR unknown command\r\n')
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password : str = None):
+        super().__init__(('127.0.0.1', 0), FakeRedisHandler)
+        self.password = password
+        self.store = {}
+        self.expiries = {}
+        self.commands = []
+        self.handlers = []
+        self.lock = threading.Lock()
+
+    # closes every connection a client has open, as a server that restarted would
+    def dropConnections(self):
+        with self.lock:
+            for handler in self.handlers:
+                handler.connection.shutdown(socket.SHUT_RDWR)
+            self.handlers = []
+
+@pytest.fixture
+def serve():
+    servers = []
+    def start(password : str = None) -> FakeRedis:
+        server = FakeRedis(password)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_put_and_get(serve):
+    server = serve()
+    cache = RedisCache(*server.server_address, ttl=90)
+
+    assert cache.get('sensor_graph:missing') is None
+    cache.put('sensor_graph:key', b'{"data": []}')
+    assert cache.get('sensor_graph:key') == b'{"data": []}'
+    assert server.expiries[b'sensor_graph:key'] == 90
+
+def test_logs_in_and_selects_the_database(serve):
+    server = serve(password='secret')
+    cache = RedisCache(*server.server_address, db=2, password='secret')
+
+    cache.put('key', b'value')
+    assert cache.get('key') == b'value'
+    assert server.commands[:2] == [b'AUTH', b'SELECT']
+
+def test_failed_login_keeps_no_connection(serve):
+    server = serve(password='secret')
+    cache = RedisCache(*server.server_address, password='wrong')
+
+    with pytest.raises(RedisError):
+        cache.get('key')
+    assert getattr(cache.local, 'connection', None) is None
+
+    # the next command logs in again rather than sending its command over a connection that never logged in
+    with pytest.raises(RedisError, match='invalid password'):
+        cache.get('key')
+    assert server.commands == [b'AUTH', b'AUTH']
+
+    cache.password = 'secret'
+    cache.put('key', b'value')
+    assert cache.get('key') == b'value'
+
+def test_reconnects_after_the_connection_drops(serve):
+    server = serve()
+    cache = RedisCache(*server.server_address)
+    cache.put('key', b'value')
+
+    server.dropConnections()
+    with pytest.raises(OSError):
+        cache.get('key')
+    assert cache.get('key') == b'value'
\ No newline at end of file